@@ -0,0 +1,229 @@
+import argparse
+import hashlib
+import http.client
+import json
+import os
+import threading
+import urllib.error
+from collections import OrderedDict
+from contextlib import suppress
+from concurrent.futures import ThreadPoolExecutor
+from ExportWriter import load_export
+from Fetcher import Fetcher
+
+
+class AudioDownloader:
+    # Layout of the audio directory:
+    #   files/<sha256 of audio>.ogg   -> each distinct file, stored once
+    #                                    however many quotes share it
+    #   partial/<sha256 of url>.part  -> unfinished downloads, resumed
+    #                                    with a Range request
+    #   manifest.ndjson               -> one {url, sha256, size} line per
+    #                                    finished url, appended as they
+    #                                    finish
+    #   audio_index.json              -> champion -> quote_id -> file
+    # URLs already in the manifest are skipped if their file is present
+    # with the recorded size (and hash, with verify=True).
+    # No file is kept if it would take files/ over `budget` bytes.
+    def __init__(self, directory='audio', fetcher=None, workers=4,
+                 budget=None, verify=False, metrics=None):
+        self.directory = directory
+        self.fetcher = fetcher if fetcher is not None else Fetcher()
+        self.workers = workers
+        self.budget = budget
+        self.verify = verify
+        self.metrics = metrics
+        self.file_dir = os.path.join(directory, 'files')
+        self.partial_dir = os.path.join(directory, 'partial')
+        self.manifest_path = os.path.join(directory, 'manifest.ndjson')
+        os.makedirs(self.file_dir, exist_ok=True)
+        os.makedirs(self.partial_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.manifest = self.load_manifest()  # url -> {sha256, size}
+        self.used = sum(os.path.getsize(os.path.join(self.file_dir, name))
+                        for name in os.listdir(self.file_dir))
+        self.over_budget = False
+
+    @staticmethod
+    def digest(data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        return hashlib.sha256(data).hexdigest()
+
+    def file_path(self, sha256):
+        return os.path.join(self.file_dir, sha256 + '.ogg')
+
+    def partial_path(self, url):
+        return os.path.join(self.partial_dir, self.digest(url) + '.part')
+
+    def load_manifest(self):
+        manifest = {}
+        try:
+            with open(self.manifest_path, 'r') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:  # Cut short by an interrupted run.
+                        continue
+                    manifest[entry['url']] = entry
+        except FileNotFoundError:
+            pass
+        return manifest
+
+    def is_done(self, url):
+        entry = self.manifest.get(url)
+        if entry is None:
+            return False
+        path = self.file_path(entry['sha256'])
+        try:
+            if os.path.getsize(path) != entry['size']:
+                return False
+        except OSError:
+            return False
+        return not self.verify or self.hash_file(path) == entry['sha256']
+
+    def hash_file(self, path):
+        sha256 = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b''):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    def download(self, url):
+        # Returns 'done', 'skipped' (over budget) or the error.
+        partial = self.partial_path(url)
+        try:
+            with open(partial, 'r+b' if os.path.exists(partial) else 'wb') \
+                    as file:
+                try:
+                    # Resumed from the end of the partial file, on every
+                    # retry too.
+                    self.fetcher.request(url, file=file)
+                except urllib.error.HTTPError as e:
+                    # 416 with Content-Range: bytes */<offset> means the
+                    # partial file already holds the whole file.
+                    offset = file.seek(0, os.SEEK_END)
+                    content_range = e.headers.get('Content-Range', '') \
+                        if e.headers is not None else ''
+                    if e.code != 416 or \
+                            content_range != 'bytes */{}'.format(offset):
+                        raise
+        except urllib.error.HTTPError as e:
+            # Not worth resuming.
+            with suppress(FileNotFoundError):
+                os.remove(partial)
+            if self.metrics is not None:
+                self.metrics.count('audio_failed')
+            return e
+        except (OSError, http.client.HTTPException) as e:
+            if self.metrics is not None:
+                self.metrics.count('audio_failed')
+            return e
+        size = os.path.getsize(partial)
+        sha256 = self.hash_file(partial)
+        path = self.file_path(sha256)
+        with self.lock:
+            if os.path.exists(path):
+                os.remove(partial)  # Same audio as another quote's.
+            elif self.budget is not None and self.used + size > self.budget:
+                os.remove(partial)
+                self.over_budget = True
+                return 'skipped'
+            else:
+                os.replace(partial, path)
+                self.used += size
+            entry = {'url': url, 'sha256': sha256, 'size': size}
+            self.manifest[url] = entry
+            with open(self.manifest_path, 'a') as file:
+                file.write(json.dumps(entry) + '\n')
+        if self.metrics is not None:
+            self.metrics.count('audio_bytes', size)
+        return 'done'
+
+    def download_all(self, urls):
+        # Downloads every url not already done, `workers` at a time.
+        # Returns url -> 'done', 'present', 'skipped' or the error.
+        results = OrderedDict()
+        todo = []
+        for url in urls:
+            if url in results:
+                continue
+            if self.is_done(url):
+                results[url] = 'present'
+            else:
+                results[url] = None
+                todo.append(url)
+
+        def job(url):
+            if self.over_budget:
+                return url, 'skipped'
+            return url, self.download(url)
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for url, result in pool.map(job, todo):
+                results[url] = result
+        return results
+
+    def download_corpus(self, corpus):
+        # Downloads the audio of every quote of an export made with
+        # --audio, and writes audio_index.json for the quotes that have
+        # their file. Returns the download_all() results.
+        results = self.download_all(
+            url for record in corpus.values()
+            for url in record.get('audio', {}).values())
+        index = OrderedDict()
+        for champion, record in corpus.items():
+            files = OrderedDict()
+            for quote_id, url in record.get('audio', {}).items():
+                if results.get(url) in {'done', 'present'}:
+                    files[quote_id] = os.path.relpath(
+                        self.file_path(self.manifest[url]['sha256']),
+                        self.directory)
+            index[champion] = files
+        tmp = os.path.join(self.directory, 'audio_index.json.tmp')
+        with open(tmp, 'w') as file:
+            json.dump(index, file, indent=4)
+        os.replace(tmp, os.path.join(self.directory, 'audio_index.json'))
+        return results
+
+
+def summarize(results):
+    counts = OrderedDict((kind, 0) for kind in
+                         ('done', 'present', 'skipped', 'failed'))
+    for result in results.values():
+        counts[result if isinstance(result, str) else 'failed'] += 1
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Download the audio of an export made with --audio.")
+    parser.add_argument('export', nargs='?', help="Defaults to"
+                        " 'quotes_list_export.json'.",
+                        default='quotes_list_export.json')
+    parser.add_argument("--dir", help="Audio directory. Defaults to"
+                        " 'audio'.", default='audio')
+    parser.add_argument("--workers", help="Concurrent downloads. Defaults to"
+                        " 4.", type=int, default=4)
+    parser.add_argument("--budget", help="Max MB of audio files kept.",
+                        type=float)
+    parser.add_argument("--verify", help="Re-hash files already downloaded"
+                        " instead of only checking their size.",
+                        action='store_true')
+    parser.add_argument("--rate", help="Max requests per second per host."
+                        " Defaults to 5.", type=float, default=5.0)
+    args = parser.parse_args()
+
+    fetcher = Fetcher(per_host=args.workers, rate=args.rate)
+    downloader = AudioDownloader(
+        args.dir, fetcher, args.workers, verify=args.verify,
+        budget=args.budget * 1024 * 1024 if args.budget else None)
+    try:
+        results = downloader.download_corpus(load_export(args.export))
+    finally:
+        fetcher.close()
+    print(", ".join("{} {}".format(n, kind)
+                    for kind, n in summarize(results).items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,293 @@
+import argparse
+import json
+import mmap
+import struct
+from collections import OrderedDict
+
+# File layout, all integers little-endian:
+#
+#   header       MAGIC, version, champion count, string count, and the
+#                offsets of the sections below
+#   strings      (count + 1) u32 offsets into the blob, then the blob of
+#                UTF-8 strings. Every distinct string is stored once.
+#   champions    one ENTRY per champion, in corpus order:
+#                name string, champ_id, record offset
+#   by name      u32 positions into the champion entries, sorted by the
+#                UTF-8 bytes of the name, for binary search
+#   records      per champion: a RECORD head (category count, audio
+#                count + 1, or 0 for a record without 'audio', and the
+#                offset of the audio pairs), one CATEGORY entry per h2
+#                (name string, quote count, offset of its quotes), then
+#                (quote_id string, quote string) pairs, then the
+#                (quote_id string, audio URL string) pairs of --audio
+#
+# Version 1 records only start with the category count, and have no
+# audio. They are still read.
+#
+# Opening a corpus only reads the header. Champions and categories are
+# decoded from the memory map when they are asked for.
+MAGIC = b'LWQC'
+VERSION = 2
+VERSIONS = {1, 2}
+HEADER = struct.Struct('<4sHHIIQQQQ')
+ENTRY = struct.Struct('<IqQ')
+RECORD = struct.Struct('<III')
+CATEGORY = struct.Struct('<III')
+U32 = struct.Struct('<I')
+PAIR = struct.Struct('<II')
+
+
+class StringTable:
+    def __init__(self):
+        self.ids = {}
+        self.strings = []
+
+    def add(self, string):
+        if string not in self.ids:
+            self.ids[string] = len(self.strings)
+            self.strings.append(string)
+        return self.ids[string]
+
+    def pack(self):
+        blobs = [string.encode('utf-8') for string in self.strings]
+        offsets, total = [], 0
+        for blob in blobs:
+            offsets.append(total)
+            total += len(blob)
+        offsets.append(total)
+        return struct.pack('<{}I'.format(len(offsets)), *offsets) + \
+            b''.join(blobs)
+
+
+def pack_corpus(corpus):
+    # corpus is a dict in the export schema, or an iterable of
+    # (champion, record) pairs.
+    items = corpus.items() if hasattr(corpus, 'items') else corpus
+    strings = StringTable()
+    entries, records, offset = [], [], 0
+    for champion, record in items:
+        champ_id = record['champ_id']
+        if not isinstance(champ_id, int) or isinstance(champ_id, bool):
+            raise ValueError("champ_id of {} is not an integer: {!r}"
+                             .format(champion, champ_id))
+        categories = list(record['quotes'].items())
+        head, body = [], []
+        body_offset = RECORD.size + CATEGORY.size * len(categories)
+        for h2, quotes in categories:
+            head.append(CATEGORY.pack(strings.add(h2), len(quotes),
+                                      body_offset))
+            for quote_id, quote in quotes.items():
+                body.append(PAIR.pack(strings.add(quote_id),
+                                      strings.add(quote)))
+            body_offset += PAIR.size * len(quotes)
+        audio = record.get('audio')
+        for quote_id, url in (audio or {}).items():
+            body.append(PAIR.pack(strings.add(quote_id), strings.add(url)))
+        head.insert(0, RECORD.pack(len(categories),
+                                   0 if audio is None else len(audio) + 1,
+                                   body_offset))
+        entries.append((strings.add(champion), champ_id, offset))
+        records.append(b''.join(head + body))
+        offset += len(records[-1])
+
+    string_section = strings.pack()
+    entry_section = b''.join(ENTRY.pack(*entry) for entry in entries)
+    by_name = sorted(range(len(entries)),
+                     key=lambda i: strings.strings[entries[i][0]]
+                     .encode('utf-8'))
+    by_name_section = struct.pack('<{}I'.format(len(by_name)), *by_name)
+
+    strings_offset = HEADER.size
+    entries_offset = strings_offset + len(string_section)
+    by_name_offset = entries_offset + len(entry_section)
+    records_offset = by_name_offset + len(by_name_section)
+    header = HEADER.pack(MAGIC, VERSION, 0, len(entries),
+                         len(strings.strings), strings_offset,
+                         entries_offset, by_name_offset, records_offset)
+    return b''.join([header, string_section, entry_section,
+                     by_name_section] + records)
+
+
+def write_corpus(corpus, path):
+    with open(path, 'wb') as file:
+        file.write(pack_corpus(corpus))
+
+
+class BinaryCorpus:
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        except ValueError:  # An empty file can't be mapped.
+            self.file.close()
+            raise ValueError("{} is not a binary quote corpus".format(path))
+        (magic, version, _, self.champion_count, self.string_count,
+         self.strings_offset, self.entries_offset, self.by_name_offset,
+         self.records_offset) = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version not in VERSIONS:
+            self.close()
+            raise ValueError("{} is not a binary quote corpus".format(path))
+        self.version = version
+        self.blob_offset = self.strings_offset + \
+            U32.size * (self.string_count + 1)
+
+    def close(self):
+        self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.champion_count
+
+    def __contains__(self, champion):
+        return self.find(champion) is not None
+
+    def __iter__(self):
+        return iter(self.champions())
+
+    def string_bytes(self, i):
+        start, end = struct.unpack_from('<II', self.data,
+                                        self.strings_offset + U32.size * i)
+        return self.data[self.blob_offset + start:self.blob_offset + end]
+
+    def string(self, i):
+        return self.string_bytes(i).decode('utf-8')
+
+    def entry(self, position):
+        return ENTRY.unpack_from(self.data,
+                                 self.entries_offset + ENTRY.size * position)
+
+    def find(self, champion):
+        # Binary search of the by-name section. Returns the champion's
+        # position in corpus order, or None.
+        key = champion.encode('utf-8')
+        low, high = 0, self.champion_count
+        while low < high:
+            mid = (low + high) // 2
+            position = U32.unpack_from(self.data,
+                                       self.by_name_offset + U32.size * mid)[0]
+            name = self.string_bytes(self.entry(position)[0])
+            if name == key:
+                return position
+            if name < key:
+                low = mid + 1
+            else:
+                high = mid
+        return None
+
+    def locate(self, champion):
+        position = self.find(champion)
+        if position is None:
+            raise KeyError(champion)
+        return self.entry(position)
+
+    def champions(self):
+        return [self.string(self.entry(i)[0])
+                for i in range(self.champion_count)]
+
+    def champ_id(self, champion):
+        return self.locate(champion)[1]
+
+    def record_head(self, champion):
+        # (record offset, category count, audio count + 1 or 0, audio
+        # offset, size of the head)
+        offset = self.records_offset + self.locate(champion)[2]
+        if self.version == 1:
+            return (offset, U32.unpack_from(self.data, offset)[0], 0, 0,
+                    U32.size)
+        return (offset,) + RECORD.unpack_from(self.data, offset) + \
+            (RECORD.size,)
+
+    def category_entries(self, champion):
+        offset, count, _, _, head_size = self.record_head(champion)
+        for i in range(count):
+            name, quote_count, quotes_offset = CATEGORY.unpack_from(
+                self.data, offset + head_size + CATEGORY.size * i)
+            yield name, quote_count, offset + quotes_offset
+
+    def categories(self, champion):
+        return [self.string(name)
+                for name, _, _ in self.category_entries(champion)]
+
+    def decode_quotes(self, quote_count, offset):
+        quotes = OrderedDict()
+        for i in range(quote_count):
+            quote_id, quote = PAIR.unpack_from(self.data,
+                                               offset + PAIR.size * i)
+            quotes[self.string(quote_id)] = self.string(quote)
+        return quotes
+
+    def quotes(self, champion, category=None):
+        # All of a champion's categories, or only the quotes of one.
+        if category is not None:
+            key = category.encode('utf-8')
+            for name, quote_count, offset in \
+                    self.category_entries(champion):
+                if self.string_bytes(name) == key:
+                    return self.decode_quotes(quote_count, offset)
+            raise KeyError(category)
+        return OrderedDict(
+            (self.string(name), self.decode_quotes(quote_count, offset))
+            for name, quote_count, offset in self.category_entries(champion))
+
+    def audio(self, champion):
+        # quote_id -> audio URL, or None for a record without 'audio'.
+        offset, _, audio_count, audio_offset, _ = self.record_head(champion)
+        if not audio_count:
+            return None
+        return self.decode_quotes(audio_count - 1, offset + audio_offset)
+
+    def record(self, champion):
+        record = OrderedDict([
+            ('champ_id', self.champ_id(champion)),
+            ('quotes', self.quotes(champion)),
+        ])
+        audio = self.audio(champion)
+        if audio is not None:
+            record['audio'] = audio
+        return record
+
+    def to_dict(self):
+        return OrderedDict((champion, self.record(champion))
+                           for champion in self.champions())
+
+
+def json_to_binary(json_path, binary_path):
+    with open(json_path, 'r') as file:
+        corpus = json.load(file, object_pairs_hook=OrderedDict)
+    write_corpus(corpus, binary_path)
+
+
+def binary_to_json(binary_path, json_path):
+    with BinaryCorpus(binary_path) as corpus:
+        dic = corpus.to_dict()
+    with open(json_path, 'w') as file:
+        json.dump(dic, file, indent=4)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert exported quotes to and from the binary corpus"
+        " format.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    pack = sub.add_parser('pack', help="JSON export to binary corpus.")
+    pack.add_argument('json_file')
+    pack.add_argument('binary_file')
+    unpack = sub.add_parser('unpack', help="Binary corpus to JSON export.")
+    unpack.add_argument('binary_file')
+    unpack.add_argument('json_file')
+    args = parser.parse_args()
+    if args.command == 'pack':
+        json_to_binary(args.json_file, args.binary_file)
+    else:
+        binary_to_json(args.binary_file, args.json_file)
+
+
+if __name__ == '__main__':
+    main()
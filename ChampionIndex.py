@@ -0,0 +1,130 @@
+import json
+import os
+import re
+import threading
+from collections import Counter
+from difflib import SequenceMatcher
+
+
+def ngrams(text, n=3):
+    # Pad with spaces so that the first and last letters get n-grams of
+    # their own, while a typo in any one letter still leaves most of
+    # the others intact.
+    text = ' ' + text.lower() + ' '
+    return {text[i:i + n] for i in range(max(len(text) - n + 1, 1))}
+
+
+class ChampionIndex:
+    def __init__(self, names, n=3, candidates=20):
+        self.names = list(names)
+        self.n = n
+        self.candidates = candidates  # Names ranked by SequenceMatcher
+        self.grams = {}  # n-gram -> indexes into self.names
+        for i, name in enumerate(self.names):
+            for gram in ngrams(name, n):
+                self.grams.setdefault(gram, []).append(i)
+
+    @classmethod
+    def from_name_id_dict(cls, name_id_dict):
+        return cls(name_id_dict['data'][champ]['name']
+                   for champ in name_id_dict['data'])
+
+    def search(self, find_me, k=5):
+        # Ranks names sharing the most n-grams with the input, then
+        # orders the best of those by SequenceMatcher ratio.
+        # Returns up to k (name, ratio) pairs, best first.
+        shared = Counter()
+        for gram in ngrams(find_me, self.n):
+            shared.update(self.grams.get(gram, ()))
+        find_me = find_me.lower()
+        ranked = []
+        for i, _ in shared.most_common(self.candidates):
+            m = SequenceMatcher(None, find_me, self.names[i].lower())
+            ranked.append((self.names[i], m.ratio()))
+        ranked.sort(key=lambda x: x[1], reverse=True)
+        return ranked[:k]
+
+    def best_match(self, find_me, cutoff=0.7):
+        ranked = self.search(find_me, k=1)
+        if ranked and ranked[0][1] >= cutoff:
+            return ranked[0][0]
+        return None
+
+
+def alias_key(name):
+    # "Kai'Sa", "kaisa" and "KAI SA" all share the alias key "kaisa".
+    return re.sub(r'[^0-9a-z]', '', name.lower())
+
+
+class ChampionTable:
+    # Bidirectional name <-> ID table for name_id_dict.json.
+    def __init__(self, name_id_dict):
+        self.version = name_id_dict.get('version')
+        # (name, id) pairs, in the order of the file.
+        self.champions = [(name_id_dict['data'][champ]['name'],
+                           name_id_dict['data'][champ]['id'])
+                          for champ in name_id_dict['data']]
+        self.by_name = {name: id_ for name, id_ in self.champions}
+        self.by_id = {id_: name for name, id_ in self.champions}
+        self.aliases = {alias_key(name): name for name, _ in self.champions}
+        self._index = None
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = ChampionIndex(name for name, _ in self.champions)
+        return self._index
+
+    def resolve(self, name):
+        # Exact name or alias, otherwise None.
+        if name in self.by_name:
+            return name
+        return self.aliases.get(alias_key(name))
+
+    def id_of(self, name, default=0):
+        name = self.resolve(name)
+        return self.by_name[name] if name is not None else default
+
+    def name_of(self, champ_id, default=None):
+        try:
+            return self.by_id.get(int(champ_id), default)
+        except (TypeError, ValueError):
+            return default
+
+
+_lock = threading.Lock()
+_tables = {}  # path -> (mtime, ChampionTable)
+
+
+def get_champion_table(path='name_id_dict.json'):
+    # Loaded once per process and shared by every caller. Reloaded if
+    # the file changes, or after invalidate_champion_table().
+    # Raises FileNotFoundError if the file is missing.
+    mtime = os.stat(path).st_mtime_ns
+    with _lock:
+        cached = _tables.get(path)
+        if cached is None or cached[0] != mtime:
+            with open(path, 'r') as file:
+                table = ChampionTable(json.load(file))
+            cached = _tables[path] = (mtime, table)
+        return cached[1]
+
+
+def invalidate_champion_table(path=None):
+    with _lock:
+        if path is None:
+            _tables.clear()
+        else:
+            _tables.pop(path, None)
+
+
+def get_champion_index(path='name_id_dict.json'):
+    return get_champion_table(path).index
+
+
+def champion_id(name, path='name_id_dict.json', default=0):
+    return get_champion_table(path).id_of(name, default)
+
+
+def champion_name(champ_id, path='name_id_dict.json', default=None):
+    return get_champion_table(path).name_of(champ_id, default)
@@ -0,0 +1,121 @@
+import argparse
+import json
+import os
+from collections import OrderedDict
+
+# On disk, every distinct quote line is stored once, in 'lines', and a
+# category maps each quote_id to the position of its line:
+#
+#   {"format": "lolwikiquotes-dedup", "version": 1,
+#    "lines": ["\"Play time!\"", ...],
+#    "champions": {"Annie": {"champ_id": 1, "quotes":
+#                  {"Attacking": {"Annie.attack6": 0, ...}}}}}
+#
+# Other keys of a record, like 'audio', are kept as they are. Expanding
+# gives back the export schema, with each line shared by every quote
+# that uses it.
+FORMAT = 'lolwikiquotes-dedup'
+VERSION = 1
+SUFFIX = '.dedup.json'
+
+
+class LineTable:
+    def __init__(self):
+        self.ids = {}
+        self.lines = []
+
+    def add(self, line):
+        if line not in self.ids:
+            self.ids[line] = len(self.lines)
+            self.lines.append(line)
+        return self.ids[line]
+
+
+def pack(corpus):
+    # corpus is a dict in the export schema, or an iterable of
+    # (champion, record) pairs.
+    items = corpus.items() if hasattr(corpus, 'items') else corpus
+    lines = LineTable()
+    champions = OrderedDict()
+    for champion, record in items:
+        packed = OrderedDict(record)
+        packed['quotes'] = OrderedDict(
+            (h2, OrderedDict((quote_id, lines.add(quote))
+                             for quote_id, quote in quotes.items()))
+            for h2, quotes in record['quotes'].items())
+        champions[champion] = packed
+    return OrderedDict([('format', FORMAT), ('version', VERSION),
+                        ('lines', lines.lines), ('champions', champions)])
+
+
+def unpack(data):
+    if data.get('format') != FORMAT or data.get('version') != VERSION:
+        raise ValueError("Not a deduplicated quote corpus")
+    lines = data['lines']
+    corpus = OrderedDict()
+    for champion, packed in data['champions'].items():
+        record = OrderedDict(packed)
+        record['quotes'] = OrderedDict(
+            (h2, OrderedDict((quote_id, lines[line])
+                             for quote_id, line in quotes.items()))
+            for h2, quotes in packed['quotes'].items())
+        corpus[champion] = record
+    return corpus
+
+
+def write(corpus, path):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as file:
+        json.dump(pack(corpus), file, separators=(',', ':'))
+    os.replace(tmp, path)
+
+
+def read(path):
+    with open(path, 'r') as file:
+        return unpack(json.load(file, object_pairs_hook=OrderedDict))
+
+
+def stats(corpus):
+    quotes = [quote for record in corpus.values()
+              for category in record['quotes'].values()
+              for quote in category.values()]
+    unique = set(quotes)
+    return OrderedDict([
+        ('quotes', len(quotes)),
+        ('unique_lines', len(unique)),
+        ('line_bytes', sum(len(quote.encode('utf-8')) for quote in quotes)),
+        ('unique_line_bytes', sum(len(quote.encode('utf-8'))
+                                  for quote in unique)),
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert exported quotes to and from the deduplicated"
+        " format, where each distinct line is stored once.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    pack_ = sub.add_parser('pack', help="JSON export to deduplicated.")
+    pack_.add_argument('json_file')
+    pack_.add_argument('dedup_file')
+    unpack_ = sub.add_parser('unpack', help="Deduplicated to JSON export.")
+    unpack_.add_argument('dedup_file')
+    unpack_.add_argument('json_file')
+    stats_ = sub.add_parser('stats', help="Count repeated lines in an"
+                            " export.")
+    stats_.add_argument('export')
+    args = parser.parse_args()
+    if args.command == 'pack':
+        with open(args.json_file, 'r') as file:
+            write(json.load(file, object_pairs_hook=OrderedDict),
+                  args.dedup_file)
+    elif args.command == 'unpack':
+        with open(args.json_file, 'w') as file:
+            json.dump(read(args.dedup_file), file, indent=4)
+    else:
+        from ExportWriter import load_export
+        for name, value in stats(load_export(args.export)).items():
+            print("{:<20}{}".format(name, value))
+
+
+if __name__ == '__main__':
+    main()
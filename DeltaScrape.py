@@ -0,0 +1,116 @@
+import json
+import os
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+API_BATCH = 50  # Max titles per MediaWiki API query
+
+
+def api_url(wiki_url):
+    return wiki_url.rstrip('/') + '/api.php'
+
+
+def page_title(champion):
+    return champion + '/Quotes'
+
+
+def fetch_revisions(fetcher, url, champions):
+    # Latest revision of each champion's Quotes page, from the MediaWiki
+    # API, as champion -> {'revid': ..., 'timestamp': ...}.
+    # Pages the wiki doesn't have map to None. Offline, nothing is
+    # known, so every champion counts as changed.
+    revisions = {}
+    if fetcher.offline:
+        return revisions
+    for i in range(0, len(champions), API_BATCH):
+        titles = {page_title(champion): champion
+                  for champion in champions[i:i + API_BATCH]}
+        query = urlencode({
+            'action': 'query',
+            'prop': 'revisions',
+            'rvprop': 'ids|timestamp',
+            'redirects': 1,
+            'format': 'json',
+            'titles': '|'.join(titles),
+        })
+        # Bypass any response cache: revision checks must be current.
+        body = fetcher.request(url + '?' + query)[3]
+        result = json.loads(body.decode('utf-8')).get('query', {})
+        for key in ('normalized', 'redirects'):
+            for entry in result.get(key, []):
+                if entry['from'] in titles:
+                    titles[entry['to']] = titles[entry['from']]
+        for page in result.get('pages', {}).values():
+            champion = titles.get(page.get('title'))
+            if champion is None:
+                continue
+            latest = page.get('revisions')
+            revisions[champion] = None if not latest else {
+                'revid': latest[0]['revid'],
+                'timestamp': latest[0]['timestamp'],
+            }
+    return revisions
+
+
+def load_revisions(path):
+    try:
+        with open(path, 'r') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+
+
+def save_revisions(revisions, path):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as file:
+        json.dump(revisions, file, indent=4, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def changed_champions(champions, revisions, previous_revisions,
+                      previous_corpus, since=None):
+    # Champions whose page must be scraped again. A champion is kept
+    # from the previous corpus only when its page is known not to have
+    # changed: either the stored revision ID matches, or, without one,
+    # the page was last edited before `since` (an ISO 8601 timestamp,
+    # as returned by the API).
+    changed = []
+    for champion in champions:
+        revision = revisions.get(champion)
+        previous = previous_revisions.get(champion)
+        if champion not in previous_corpus or revision is None:
+            changed.append(champion)
+        elif previous is not None:
+            if previous['revid'] != revision['revid']:
+                changed.append(champion)
+        elif since is None or revision['timestamp'] > since:
+            changed.append(champion)
+    return changed
+
+
+def quote_keys(record):
+    return OrderedDict(((h2, quote_id), quote)
+                       for h2, quotes in record['quotes'].items()
+                       for quote_id, quote in quotes.items())
+
+
+def diff_corpora(old, new):
+    # champion -> {'added': [...], 'removed': [...], 'changed': [...]},
+    # each a list of [h2, quote_id]. Unchanged champions are left out.
+    empty = {'quotes': {}}
+    diff = OrderedDict()
+    for champion in list(new) + [c for c in old if c not in new]:
+        old_quotes = quote_keys(old.get(champion, empty))
+        new_quotes = quote_keys(new.get(champion, empty))
+        entry = OrderedDict([
+            ('added', [list(key) for key in new_quotes
+                       if key not in old_quotes]),
+            ('removed', [list(key) for key in old_quotes
+                         if key not in new_quotes]),
+            ('changed', [list(key) for key in new_quotes
+                         if key in old_quotes and
+                         old_quotes[key] != new_quotes[key]]),
+        ])
+        if any(entry.values()):
+            diff[champion] = entry
+    return diff
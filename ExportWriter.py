@@ -0,0 +1,114 @@
+import json
+import os
+from collections import OrderedDict
+from contextlib import nullcontext
+from BinaryCorpus import write_corpus
+import DedupCorpus
+
+
+class ExportWriter:
+    # Champions are appended to a spool file, one JSON object per line,
+    # as soon as they finish. close() then writes the final document in
+    # a single pass over the spool, instead of re-reading and rewriting
+    # the whole export once per champion.
+    # With ndjson=True the spool itself is the output.
+    # If a QuoteIndex and its path are given, each champion is also
+    # indexed as it is written, and the index is saved on close().
+    # With binary_file, close() also writes a BinaryCorpus of the export,
+    # and with dedup_file, a DedupCorpus.
+    # Time spent is recorded under the 'export' stage of `metrics`.
+    def __init__(self, json_file, ndjson=False, index=None, index_file=None,
+                 binary_file=None, dedup_file=None, metrics=None):
+        self.json_file = json_file
+        self.metrics = metrics
+        self.binary_file = binary_file
+        self.dedup_file = dedup_file
+        self.ndjson = ndjson
+        self.index = index
+        self.index_file = index_file
+        self.spool_file = json_file if ndjson else json_file + '.part'
+        self.spool = open(self.spool_file, 'w')
+        self.offsets = {}  # champion -> offset of its latest spooled line
+        self.order = []  # champions, in the order first written
+
+    def timer(self):
+        if self.metrics is None:
+            return nullcontext()
+        return self.metrics.timer('export')
+
+    def write(self, base_dict):
+        with self.timer():
+            for champion, record in base_dict.items():
+                if champion not in self.offsets:
+                    self.order.append(champion)
+                self.offsets[champion] = self.spool.tell()
+                self.spool.write(json.dumps({champion: record}) + '\n')
+                if self.index is not None:
+                    self.index.add_champion(champion, record)
+            self.spool.flush()
+
+    def close(self):
+        if self.spool.closed:
+            return
+        with self.timer():
+            self.finish()
+
+    def finish(self):
+        self.spool.close()
+        if self.index is not None:
+            self.index.save(self.index_file)
+        if self.binary_file is not None:
+            write_corpus(((champion, record[champion])
+                          for champion, record in self.records()),
+                         self.binary_file)
+        if self.dedup_file is not None:
+            DedupCorpus.write(((champion, record[champion])
+                               for champion, record in self.records()),
+                              self.dedup_file)
+        if self.ndjson:
+            return
+        tmp_file = self.json_file + '.tmp'
+        with open(tmp_file, 'w') as file:
+            if not self.order:
+                file.write('{}')
+            for i, (_, record) in enumerate(self.records()):
+                chunk = json.dumps(record, indent=4)[2:-2]
+                file.write(('{\n' if i == 0 else ',\n') + chunk)
+            if self.order:
+                file.write('\n}')
+        os.replace(tmp_file, self.json_file)
+        os.remove(self.spool_file)
+
+    def records(self):
+        # Yields (champion, {champion: record}) from the spool in the
+        # order of json.dump(dict, file, indent=4) of the merged
+        # dictionary: a champion written twice keeps its first position
+        # and its latest record, just like dict.update().
+        with open(self.spool_file, 'r') as spool:
+            for champion in self.order:
+                spool.seek(self.offsets[champion])
+                yield champion, json.loads(spool.readline())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        # Finish the document even if the run was interrupted, so the
+        # export holds every champion scraped so far.
+        self.close()
+
+
+def load_export(path):
+    # The JSON export, an NDJSON export with one champion per line, or a
+    # DedupCorpus.
+    if path.endswith(DedupCorpus.SUFFIX):
+        return DedupCorpus.read(path)
+    with open(path, 'r') as file:
+        if path.endswith('.ndjson'):
+            corpus = OrderedDict()
+            for line in file:
+                if line.strip():
+                    corpus.update(json.loads(
+                        line, object_pairs_hook=OrderedDict))
+            return corpus
+        return json.load(file, object_pairs_hook=OrderedDict)
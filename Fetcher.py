@@ -0,0 +1,284 @@
+import http.client
+import os
+import random
+import threading
+import time
+import urllib.error
+from email.utils import parsedate_to_datetime
+from urllib.parse import urljoin, urlsplit
+
+# Responses worth retrying: throttling and transient server errors.
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class HostLimiter:
+    # AIMD concurrency limit for one host. Each fast success raises the
+    # limit by 1/limit (about one more request in flight per round of
+    # successes), up to max_limit. A throttled, failed or slower than
+    # target_latency response halves it, at most once per latency window.
+    def __init__(self, max_limit, target_latency=None):
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.limit = 1.0
+        self.in_flight = 0
+        self.last_decrease = 0
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        with self.cond:
+            while self.in_flight >= int(self.limit):
+                self.cond.wait()
+            self.in_flight += 1
+
+    def release(self, ok, latency):
+        with self.cond:
+            self.in_flight -= 1
+            slow = (self.target_latency is not None and
+                    latency > self.target_latency)
+            if ok and not slow:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            else:
+                now = time.monotonic()
+                if now - self.last_decrease > latency:
+                    self.limit = max(1.0, self.limit / 2)
+                    self.last_decrease = now
+            self.cond.notify_all()
+
+
+def retry_after(msg, cap):
+    # Seconds to wait from a Retry-After header, either delay-seconds
+    # or an HTTP-date. None if absent or unreadable.
+    value = msg.get('Retry-After') if msg is not None else None
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0), cap)
+
+
+def write_body(response, file, chunk_size=64 * 1024):
+    start = 0
+    if response.status == 206:
+        # Content-Range: bytes <start>-<end>/<size>
+        content_range = response.getheader('Content-Range', '')
+        try:
+            start = int(content_range.split()[1].split('-')[0])
+        except (IndexError, ValueError):
+            raise http.client.HTTPException(
+                "Bad Content-Range: " + repr(content_range))
+    file.seek(start)
+    file.truncate()
+    while True:
+        chunk = response.read(chunk_size)
+        if not chunk:
+            break
+        file.write(chunk)
+    file.flush()
+    if response.length:
+        # read(amt) ends quietly when the connection drops early. What
+        # was written stays, for a Range request to resume from.
+        raise http.client.IncompleteRead(b'', response.length)
+
+
+class Fetcher:
+    def __init__(self, args=None, per_host=4, rate=5.0, timeout=30,
+                 max_redirects=5, cache=None, offline=False, retries=4,
+                 backoff=1.0, max_backoff=60, target_latency=5.0,
+                 metrics=None):
+        self.args = args  # Print hidden exceptions if args.e
+        self.per_host = per_host  # Max requests in flight per host
+        self.rate = rate  # Max requests started per second, per host
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self.cache = cache  # ResponseCache, or None to always hit the network
+        self.offline = offline  # Replay from cache only, never hit the network
+        self.retries = retries  # Retries per request after the first try
+        self.backoff = backoff  # Seconds; doubles with every retry
+        self.max_backoff = max_backoff  # Also caps Retry-After
+        self.target_latency = target_latency  # Seconds, for HostLimiter
+        self.metrics = metrics  # Counts retries, if given
+        self.lock = threading.Lock()
+        self.limiters = {}  # host -> HostLimiter
+        self.next_start = {}  # host -> earliest time of the next request
+        # Idle keep-alive connections, keyed by (scheme, host).
+        # At most per_host connections are kept per key.
+        self.idle = {}
+
+    def limiter(self, host):
+        with self.lock:
+            if host not in self.limiters:
+                self.limiters[host] = HostLimiter(self.per_host,
+                                                  self.target_latency)
+            return self.limiters[host]
+
+    def wait_for_rate(self, host):
+        if not self.rate:
+            with self.lock:
+                start = self.next_start.get(host, 0)
+            if start > time.monotonic():
+                time.sleep(start - time.monotonic())
+            return
+        # Reserve the next free start time for this host, then sleep
+        # outside the lock until it arrives.
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_start.get(host, now))
+            self.next_start[host] = start + 1 / self.rate
+        if start > now:
+            time.sleep(start - now)
+
+    def pause_host(self, host, seconds):
+        # Hold back every request to host, e.g. for a Retry-After.
+        with self.lock:
+            start = time.monotonic() + seconds
+            self.next_start[host] = max(self.next_start.get(host, 0), start)
+
+    def get_connection(self, scheme, host):
+        with self.lock:
+            pool = self.idle.get((scheme, host))
+            if pool:
+                return pool.pop(), True
+        if scheme == 'https':
+            conn = http.client.HTTPSConnection(host, timeout=self.timeout)
+        else:
+            conn = http.client.HTTPConnection(host, timeout=self.timeout)
+        return conn, False
+
+    def release_connection(self, scheme, host, conn):
+        with self.lock:
+            pool = self.idle.setdefault((scheme, host), [])
+            if len(pool) < self.per_host:
+                pool.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        with self.lock:
+            pools, self.idle = self.idle, {}
+        for pool in pools.values():
+            for conn in pool:
+                conn.close()
+
+    def send(self, url, headers=None, file=None):
+        # With `file`, a seekable binary file, a 200 or 206 response body
+        # is streamed into it instead of returned: a 200 replaces its
+        # contents, a 206 is written from the start of its Content-Range.
+        # A file that isn't empty is resumed with a Range request from
+        # its end, which is read again on every attempt, so that a retry
+        # after a dropped connection continues where it stopped.
+        parts = urlsplit(url)
+        scheme, host = parts.scheme or 'http', parts.netloc
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        headers = dict(headers or {})
+        headers.setdefault('User-Agent', 'LoLWikiQuotes')
+        if file is not None:
+            offset = file.seek(0, os.SEEK_END)
+            if offset:
+                headers['Range'] = 'bytes={}-'.format(offset)
+        conn, reused = self.get_connection(scheme, host)
+        try:
+            conn.request('GET', path, headers=headers)
+            response = conn.getresponse()
+            if file is not None and response.status in {200, 206}:
+                body = b''
+                write_body(response, file)
+            else:
+                body = response.read()
+        except (http.client.RemoteDisconnected, ConnectionResetError,
+                BrokenPipeError):
+            conn.close()
+            if not reused:
+                raise
+            # The server closed an idle keep-alive connection.
+            # Retry once on a fresh connection.
+            return self.send(url, headers, file)
+        except Exception:
+            conn.close()
+            raise
+        if response.will_close:
+            conn.close()
+        else:
+            self.release_connection(scheme, host, conn)
+        return response.status, response.msg, body
+
+    def send_with_retries(self, url, headers=None, file=None):
+        # Retries throttling, server errors and network errors with
+        # jittered exponential backoff, or as long as Retry-After asks.
+        host = urlsplit(url).netloc
+        limiter = self.limiter(host)
+        for attempt in range(self.retries + 1):
+            limiter.acquire()
+            start = time.monotonic()
+            status = msg = error = None
+            try:
+                self.wait_for_rate(host)
+                start = time.monotonic()
+                status, msg, body = self.send(url, headers, file)
+            except (OSError, http.client.HTTPException) as e:
+                error = e
+            finally:
+                ok = error is None and status not in RETRY_STATUSES
+                limiter.release(ok, time.monotonic() - start)
+            if ok:
+                return status, msg, body
+            if attempt == self.retries:
+                break
+            if self.metrics is not None:
+                self.metrics.count('retries')
+            delay = retry_after(msg, self.max_backoff)
+            if self.args is not None and self.args.e:
+                print("Retrying", url, "after", error or status)
+            if delay is not None:
+                # Every request to the host waits, not just this one.
+                self.pause_host(host, delay)
+            else:
+                time.sleep(random.uniform(
+                    0, min(self.max_backoff, self.backoff * 2 ** attempt)))
+        if error is not None:
+            raise error
+        raise urllib.error.HTTPError(
+            url, status, http.client.responses.get(status, ''), msg, None)
+
+    def request(self, url, headers=None, file=None):
+        if self.offline:
+            raise urllib.error.HTTPError(url, 504, 'Offline', None, None)
+        for _ in range(self.max_redirects + 1):
+            status, msg, body = self.send_with_retries(url, headers, file)
+            if status in {301, 302, 303, 307, 308} and msg.get('Location'):
+                url = urljoin(url, msg['Location'])
+                continue
+            if status >= 400:
+                raise urllib.error.HTTPError(
+                    url, status, http.client.responses.get(status, ''),
+                    msg, None)
+            return url, status, msg, body
+        raise urllib.error.HTTPError(url, status, 'Too many redirects',
+                                     msg, None)
+
+    def fetch(self, url):
+        if self.cache is None:
+            if self.offline:
+                raise urllib.error.HTTPError(url, 504, 'Not cached (offline)',
+                                             None, None)
+            return self.request(url)[3]
+        cached = self.cache.get(url)
+        if self.offline:
+            if cached is None:
+                # 504 is what an only-if-cached request answers on a miss.
+                raise urllib.error.HTTPError(url, 504, 'Not cached (offline)',
+                                             None, None)
+            return cached[1]
+        headers = self.cache.validators(cached[0]) if cached else None
+        _, status, msg, body = self.request(url, headers)
+        if status == 304 and cached:
+            self.cache.touch(url, cached[0])
+            return cached[1]
+        self.cache.store(url, msg, body)
+        return body
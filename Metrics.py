@@ -0,0 +1,144 @@
+import json
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+
+
+class Metrics:
+    # Per-stage timers and counters for a scrape, in total and per
+    # champion. Safe to share between threads. Worker processes keep
+    # their own Metrics and send to_dict() back to be merge()d.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.stage_seconds = Counter()  # stage -> seconds
+        self.stage_calls = Counter()  # stage -> times timed
+        self.counters = Counter()  # name -> count
+        self.champions = OrderedDict()  # champion -> Counter
+        self.failures = OrderedDict()  # champion -> error, if it failed
+
+    def champion(self, champion):
+        if champion not in self.champions:
+            self.champions[champion] = Counter()
+        return self.champions[champion]
+
+    def add_time(self, stage, seconds, champion=None):
+        with self.lock:
+            self.stage_seconds[stage] += seconds
+            self.stage_calls[stage] += 1
+            if champion is not None:
+                self.champion(champion)[stage + '_seconds'] += seconds
+
+    @contextmanager
+    def timer(self, stage, champion=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start, champion)
+
+    def count(self, name, n=1, champion=None):
+        with self.lock:
+            self.counters[name] += n
+            if champion is not None:
+                self.champion(champion)[name] += n
+
+    def fail(self, champion, error):
+        self.count('failed_fetches', champion=champion)
+        with self.lock:
+            self.failures[champion] = str(error)
+
+    def take_failures(self):
+        # Returns and forgets the failures so far, e.g. before retrying.
+        with self.lock:
+            failures, self.failures = self.failures, OrderedDict()
+            return failures
+
+    def count_handlers(self, handler_calls, champion=None):
+        # handler_calls is a Counter of tag name -> tags visited.
+        with self.lock:
+            for name, n in handler_calls.items():
+                self.counters['handler_calls.' + name] += n
+                self.counters['tags_visited'] += n
+                if champion is not None:
+                    self.champion(champion)['tags_visited'] += n
+
+    def to_dict(self):
+        with self.lock:
+            return OrderedDict([
+                ('started', time.strftime('%Y-%m-%dT%H:%M:%SZ',
+                                          time.gmtime(self.started))),
+                ('elapsed_seconds', time.time() - self.started),
+                ('stages', OrderedDict(
+                    (stage, {'seconds': self.stage_seconds[stage],
+                             'calls': self.stage_calls[stage]})
+                    for stage in sorted(self.stage_seconds))),
+                ('counters', OrderedDict(sorted(self.counters.items()))),
+                ('champions', OrderedDict(
+                    (champion, OrderedDict(sorted(counts.items())))
+                    for champion, counts in self.champions.items())),
+                ('failures', OrderedDict(self.failures)),
+            ])
+
+    def merge(self, data):
+        with self.lock:
+            for stage, stats in data['stages'].items():
+                self.stage_seconds[stage] += stats['seconds']
+                self.stage_calls[stage] += stats['calls']
+            self.counters.update(data['counters'])
+            for champion, counts in data['champions'].items():
+                self.champion(champion).update(counts)
+            self.failures.update(data.get('failures', {}))
+
+    def to_prometheus(self):
+        data = self.to_dict()
+        lines = [
+            '# TYPE lolwikiquotes_elapsed_seconds gauge',
+            'lolwikiquotes_elapsed_seconds {}'.format(
+                data['elapsed_seconds']),
+            '# TYPE lolwikiquotes_stage_seconds_total counter',
+        ]
+        for stage, stats in data['stages'].items():
+            lines.append('lolwikiquotes_stage_seconds_total{{stage="{}"}} {}'
+                         .format(stage, stats['seconds']))
+        lines.append('# TYPE lolwikiquotes_stage_calls_total counter')
+        for stage, stats in data['stages'].items():
+            lines.append('lolwikiquotes_stage_calls_total{{stage="{}"}} {}'
+                         .format(stage, stats['calls']))
+        lines.append('# TYPE lolwikiquotes_handler_calls_total counter')
+        for name, n in data['counters'].items():
+            if name.startswith('handler_calls.'):
+                lines.append(
+                    'lolwikiquotes_handler_calls_total{{tag="{}"}} {}'
+                    .format(name.split('.', 1)[1], n))
+        for name, n in data['counters'].items():
+            if not name.startswith('handler_calls.'):
+                lines.append('# TYPE lolwikiquotes_{}_total counter'
+                             .format(name))
+                lines.append('lolwikiquotes_{}_total {}'.format(name, n))
+        lines.append('# TYPE lolwikiquotes_champion_seconds gauge')
+        for champion, counts in data['champions'].items():
+            label = champion.replace('\\', '\\\\').replace('"', '\\"')
+            for name, value in counts.items():
+                if name.endswith('_seconds'):
+                    lines.append(
+                        'lolwikiquotes_champion_seconds'
+                        '{{champion="{}",stage="{}"}} {}'
+                        .format(label, name[:-len('_seconds')], value))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        # Prometheus textfile format for *.prom, JSON otherwise.
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as file:
+            if path.endswith('.prom'):
+                file.write(self.to_prometheus())
+            else:
+                json.dump(self.to_dict(), file, indent=4)
+        os.replace(tmp, path)
+
+
+# Shared by everything in this process unless told otherwise.
+METRICS = Metrics()
@@ -0,0 +1,161 @@
+import argparse
+import json
+import os
+import sys
+from ChampionIndex import alias_key, get_champion_table
+
+# Read-only lookups in name_id_dict.json and an existing export. Nothing
+# here fetches pages or talks to the Riot API, and neither bs4 nor
+# riotwatcher is imported, so each query starts in a few milliseconds.
+# Run as `python QuoteQuery.py ...` or `python wiki.py query ...`.
+
+EXPORT = 'quotes_list_export.json'
+
+
+def resolve(table, name_or_id):
+    # (name, champ_id) from a name, alias, typo or ID, otherwise None.
+    if name_or_id.isdigit():
+        name = table.name_of(name_or_id)
+    else:
+        name = table.resolve(name_or_id) or \
+            table.index.best_match(name_or_id, cutoff=0.7)
+    return None if name is None else (name, table.by_name[name])
+
+
+class Export:
+    # The records of an export. A binary corpus (.lwqc) is memory-mapped
+    # and only the champions asked for are decoded. JSON and NDJSON
+    # exports are read whole.
+    def __init__(self, path):
+        self.path = path
+        if path.endswith('.lwqc'):
+            from BinaryCorpus import BinaryCorpus
+            self.corpus = BinaryCorpus(path)
+        else:
+            from ExportWriter import load_export
+            self.corpus = load_export(path)
+
+    def champion(self, name_or_id):
+        # The export's own name for a champion, via name_id_dict.json if
+        # it is there, otherwise by exact name or alias.
+        if os.path.exists('name_id_dict.json'):
+            found = resolve(get_champion_table(), name_or_id)
+            if found is not None and found[0] in self.corpus:
+                return found[0]
+        if name_or_id in self.corpus:
+            return name_or_id
+        key = alias_key(name_or_id)
+        for champion in self.corpus:
+            if alias_key(champion) == key:
+                return champion
+        return None
+
+    def record(self, champion):
+        if hasattr(self.corpus, 'record'):
+            return self.corpus.record(champion)
+        return self.corpus[champion]
+
+
+def query_champion(args):
+    found = resolve(get_champion_table(), args.champion)
+    if found is None:
+        print("No champions found for input:", args.champion)
+        return 1
+    print("{1}\t{0}".format(*found))
+    return 0
+
+
+def query_champions(args):
+    for name, champ_id in get_champion_table().champions:
+        print("{}\t{}".format(champ_id, name))
+    return 0
+
+
+def query_quotes(args):
+    export = Export(args.export)
+    champion = export.champion(args.champion)
+    if champion is None:
+        print("No champion", args.champion, "in", args.export)
+        return 1
+    quotes = export.record(champion)['quotes']
+    if args.category is not None:
+        key = ' '.join(args.category.lower().split())
+        quotes = {h2: category_quotes
+                  for h2, category_quotes in quotes.items()
+                  if ' '.join(h2.lower().split()) == key}
+    if args.json:
+        print(json.dumps(quotes, indent=4))
+        return 0
+    for h2, category_quotes in quotes.items():
+        print(h2)
+        for quote_id, quote in category_quotes.items():
+            print("  {}\t{}".format(quote_id, quote))
+    return 0
+
+
+def query_categories(args):
+    export = Export(args.export)
+    champion = export.champion(args.champion)
+    if champion is None:
+        print("No champion", args.champion, "in", args.export)
+        return 1
+    for h2, quotes in export.record(champion)['quotes'].items():
+        print("{}\t{}".format(len(quotes), h2))
+    return 0
+
+
+def query_search(args):
+    from QuoteSearch import QuoteIndex
+    index = QuoteIndex.load(args.index)
+    for result in index.search(args.query, args.champion, args.category,
+                               args.k):
+        print("{score:.3f}\t{champion}\t{category}\t{quote_id}\t{quote}"
+              .format(**result))
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='wiki.py query', description="Look up champions and exported"
+        " quotes without scraping.")
+    sub = parser.add_subparsers(dest='command', required=True)
+    champion = sub.add_parser('champion', help="ID and name of a champion,"
+                              " by name, alias or ID.")
+    champion.add_argument('champion')
+    champion.set_defaults(func=query_champion)
+    champions = sub.add_parser('champions', help="Every champion in"
+                               " name_id_dict.json.")
+    champions.set_defaults(func=query_champions)
+    quotes = sub.add_parser('quotes', help="A champion's exported quotes.")
+    quotes.add_argument('champion')
+    quotes.add_argument("--category", help="Only this h2 category.")
+    quotes.add_argument("--json", help="Print JSON.", action='store_true')
+    categories = sub.add_parser('categories', help="A champion's h2"
+                                " categories and their quote counts.")
+    categories.add_argument('champion')
+    for command, func in ((quotes, query_quotes),
+                          (categories, query_categories)):
+        command.add_argument("--export", help="Export to read: .json,"
+                             " .ndjson, .dedup.json or .lwqc. Defaults to '" +
+                             EXPORT + "'.", default=EXPORT)
+        command.set_defaults(func=func)
+    search = sub.add_parser('search', help="Search the quote index. Use"
+                            " quotes for phrases.")
+    search.add_argument('query')
+    search.add_argument("-c", "--champion", help="Only this champion.")
+    search.add_argument("--category", help="Only this h2 category.")
+    search.add_argument("-k", help="Number of results. Defaults to 10.",
+                        type=int, default=10)
+    search.add_argument("--index", help="Index file. Defaults to"
+                        " 'quotes_index.json'.", default='quotes_index.json')
+    search.set_defaults(func=query_search)
+    args = parser.parse_args(argv)
+    try:
+        return args.func(args)
+    except FileNotFoundError as e:
+        print(e)
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
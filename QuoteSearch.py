@@ -0,0 +1,223 @@
+import argparse
+import json
+import math
+import os
+import re
+from collections import Counter
+
+TOKEN_RE = re.compile(r"\w+(?:'\w+)*")
+PHRASE_RE = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def category_key(h2):
+    # "Upon Casting  Recall" and "upon casting recall" are one category.
+    return ' '.join(h2.lower().split())
+
+
+class QuoteIndex:
+    # Inverted index over an exported corpus:
+    #   {champion: {'champ_id': id, 'quotes': {h2: {quote_id: quote}}}}
+    # Every quote is one document. Postings keep term positions so that
+    # "quoted phrases" can be matched, and results are ranked by BM25.
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.docs = []  # doc -> [champion, h2, quote_id, quote] or None
+        self.lengths = []  # doc -> number of terms
+        self.postings = {}  # term -> {doc: [positions]}
+        self.by_champion = {}  # champion -> [doc]
+        self.total_length = 0
+        self.doc_count = 0
+
+    @classmethod
+    def from_corpus(cls, corpus):
+        index = cls()
+        for champion, record in corpus.items():
+            index.add_champion(champion, record)
+        return index
+
+    def remove_champion(self, champion):
+        for doc in self.by_champion.pop(champion, ()):
+            terms = tokenize(self.docs[doc][3])
+            for term in set(terms):
+                postings = self.postings[term]
+                del postings[doc]
+                if not postings:
+                    del self.postings[term]
+            self.total_length -= self.lengths[doc]
+            self.doc_count -= 1
+            self.docs[doc] = None
+            self.lengths[doc] = 0
+
+    def add_champion(self, champion, record):
+        # Replaces anything previously indexed for this champion, so a
+        # rescraped champion can be fed straight in.
+        self.remove_champion(champion)
+        docs = self.by_champion[champion] = []
+        for h2, quotes in record['quotes'].items():
+            for quote_id, quote in quotes.items():
+                doc = len(self.docs)
+                terms = tokenize(quote)
+                self.docs.append([champion, h2, quote_id, quote])
+                self.lengths.append(len(terms))
+                for position, term in enumerate(terms):
+                    self.postings.setdefault(term, {}) \
+                        .setdefault(doc, []).append(position)
+                self.total_length += len(terms)
+                self.doc_count += 1
+                docs.append(doc)
+
+    @staticmethod
+    def parse_query(query):
+        # Returns a list of phrases, each a list of terms.
+        # Unquoted words are single-term phrases.
+        phrases = []
+        for quoted, word in PHRASE_RE.findall(query):
+            terms = tokenize(quoted if quoted else word)
+            if terms:
+                phrases.append(terms)
+        return phrases
+
+    def phrase_docs(self, terms):
+        # doc -> number of times the phrase occurs in it.
+        first = self.postings.get(terms[0], {})
+        matches = {}
+        for doc, positions in first.items():
+            starts = set(positions)
+            for offset, term in enumerate(terms[1:], 1):
+                later = self.postings.get(term, {}).get(doc)
+                if not later:
+                    starts = set()
+                    break
+                starts &= {p - offset for p in later}
+                if not starts:
+                    break
+            if starts:
+                matches[doc] = len(starts)
+        return matches
+
+    def search(self, query, champion=None, category=None, k=10):
+        # Every phrase must match. Returns up to k result dicts, best first.
+        phrases = self.parse_query(query)
+        if not phrases or not self.doc_count:
+            return []
+        matches = [self.phrase_docs(terms) for terms in phrases]
+        candidates = set(min(matches, key=len))
+        for m in matches:
+            candidates &= m.keys()
+        if champion is not None:
+            candidates &= set(self.by_champion.get(champion, ()))
+        if category is not None:
+            key = category_key(category)
+            candidates = {doc for doc in candidates
+                          if category_key(self.docs[doc][1]) == key}
+        avg_length = self.total_length / self.doc_count
+        scores = Counter()
+        for m in matches:
+            # A phrase counts as one term, with its own document frequency.
+            idf = math.log(1 + (self.doc_count - len(m) + 0.5) /
+                           (len(m) + 0.5))
+            for doc in candidates:
+                tf = m[doc]
+                norm = self.k1 * (1 - self.b + self.b *
+                                  self.lengths[doc] / avg_length)
+                scores[doc] += idf * tf * (self.k1 + 1) / (tf + norm)
+        results = []
+        for doc, score in scores.most_common(k):
+            champ, h2, quote_id, quote = self.docs[doc]
+            results.append({
+                'champion': champ,
+                'category': h2,
+                'quote_id': quote_id,
+                'quote': quote,
+                'score': score,
+            })
+        return results
+
+    def save(self, path):
+        # Documents removed by remove_champion() are dropped, and the
+        # remaining ones renumbered.
+        renumber, docs = {}, []
+        for doc, entry in enumerate(self.docs):
+            if entry is not None:
+                renumber[doc] = len(docs)
+                docs.append(entry)
+        data = {
+            'k1': self.k1,
+            'b': self.b,
+            'docs': docs,
+            'lengths': [self.lengths[doc] for doc in renumber],
+            'postings': {term: [[renumber[doc], positions]
+                                for doc, positions in postings.items()]
+                         for term, postings in self.postings.items()},
+        }
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as file:
+            json.dump(data, file, separators=(',', ':'))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r') as file:
+            data = json.load(file)
+        index = cls(data['k1'], data['b'])
+        index.docs = data['docs']
+        index.lengths = data['lengths']
+        index.postings = {term: {doc: positions for doc, positions in postings}
+                          for term, postings in data['postings'].items()}
+        for doc, entry in enumerate(index.docs):
+            index.by_champion.setdefault(entry[0], []).append(doc)
+        index.total_length = sum(index.lengths)
+        index.doc_count = len(index.docs)
+        return index
+
+    @classmethod
+    def open(cls, path):
+        # Loads the index at path, or starts an empty one.
+        try:
+            return cls.load(path)
+        except FileNotFoundError:
+            return cls()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build or query a full-text index of exported quotes.")
+    parser.add_argument("--index", help="Index file. Defaults to"
+                        " 'quotes_index.json'.", default='quotes_index.json')
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build', help="Index one or more exported"
+                           " corpora: JSON, NDJSON or .dedup.json. Later"
+                           " files replace earlier champions.")
+    build.add_argument('corpus', nargs='+')
+    query = sub.add_parser('query', help="Search the index. Use quotes for"
+                           " phrases.")
+    query.add_argument('query')
+    query.add_argument("-c", "--champion", help="Only this champion.")
+    query.add_argument("--category", help="Only this h2 category.")
+    query.add_argument("-k", help="Number of results. Defaults to 10.",
+                       type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        from ExportWriter import load_export
+        index = QuoteIndex()
+        for corpus in args.corpus:
+            for champion, record in load_export(corpus).items():
+                index.add_champion(champion, record)
+        index.save(args.index)
+        print("Indexed", index.doc_count, "quotes to", args.index)
+    else:
+        index = QuoteIndex.load(args.index)
+        for result in index.search(args.query, args.champion, args.category,
+                                   args.k):
+            print("{score:.3f}\t{champion}\t{category}\t{quote_id}\t{quote}"
+                  .format(**result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,289 @@
+import argparse
+import http.server
+import json
+import os
+import random
+import threading
+from collections import OrderedDict
+from urllib.parse import parse_qs, unquote, urlsplit
+from ChampionIndex import alias_key
+from ExportWriter import load_export
+from QuoteSearch import QuoteIndex, category_key
+
+
+class QuoteStore:
+    # One loaded export, indexed by champion name (and alias), champion
+    # ID, and h2 category. Never modified once built: a reload builds a
+    # new store and swaps it in.
+    def __init__(self, corpus, mtime=None):
+        self.corpus = corpus
+        self.mtime = mtime
+        self.by_alias = {alias_key(champion): champion for champion in corpus}
+        self.by_id = {record['champ_id']: champion
+                      for champion, record in corpus.items()
+                      if record['champ_id']}
+        self.by_category = {}  # category key -> [(champion, h2, id, quote)]
+        self.quotes = []  # every (champion, h2, quote_id, quote)
+        for champion, record in corpus.items():
+            for h2, quotes in record['quotes'].items():
+                entries = self.by_category.setdefault(category_key(h2), [])
+                for quote_id, quote in quotes.items():
+                    entries.append((champion, h2, quote_id, quote))
+                    self.quotes.append(entries[-1])
+        self.search_index = QuoteIndex.from_corpus(corpus)
+
+    @classmethod
+    def from_file(cls, path):
+        mtime = os.stat(path).st_mtime_ns
+        return cls(load_export(path), mtime)
+
+    def champion(self, name_or_id):
+        # Champion name, alias or ID, otherwise None.
+        if name_or_id in self.corpus:
+            return name_or_id
+        if name_or_id.isdigit():
+            return self.by_id.get(int(name_or_id))
+        return self.by_alias.get(alias_key(name_or_id))
+
+    def categories(self, champion, category):
+        # (h2, quotes) of a champion's categories matching `category`.
+        key = category_key(category)
+        return [(h2, quotes) for h2, quotes
+                in self.corpus[champion]['quotes'].items()
+                if category_key(h2) == key]
+
+    def pool(self, champion=None, category=None):
+        # Quotes to pick from at random, as (champion, h2, id, quote).
+        if champion is None and category is None:
+            return self.quotes
+        if champion is None:
+            return self.by_category.get(category_key(category), [])
+        if category is None:
+            return [(champion, h2, quote_id, quote) for h2, quotes
+                    in self.corpus[champion]['quotes'].items()
+                    for quote_id, quote in quotes.items()]
+        return [(champion, h2, quote_id, quote)
+                for h2, quotes in self.categories(champion, category)
+                for quote_id, quote in quotes.items()]
+
+
+class LRUCache:
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class QuoteService:
+    # Answers requests from the current QuoteStore. A watcher thread
+    # stat()s the export every `reload_interval` seconds and, when its
+    # mtime changes, builds a new store and swaps it in. Requests are
+    # served from the old store in the meantime.
+    def __init__(self, path, cache_size=1024, reload_interval=1.0):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.cache = LRUCache(cache_size)
+        self.store = QuoteStore.from_file(path)
+        self.stopped = threading.Event()
+        if reload_interval > 0:
+            threading.Thread(target=self.watch, daemon=True).start()
+
+    def watch(self):
+        while not self.stopped.wait(self.reload_interval):
+            self.reload_if_changed()
+
+    def stop(self):
+        self.stopped.set()
+
+    def reload_if_changed(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            if mtime == self.store.mtime:
+                return False
+            store = QuoteStore.from_file(self.path)
+        except (OSError, ValueError) as e:
+            # Missing or half-written: keep serving the last good export.
+            print("Not reloading", self.path + ':', e)
+            return False
+        self.store = store
+        self.cache.clear()
+        print("Reloaded", self.path)
+        return True
+
+    def handle(self, path, query):
+        # Returns (status, body bytes). Everything but /random is cached.
+        store = self.store
+        if path == '/random':
+            return self.random_quote(store, query)
+        key = (store.mtime, path, tuple(sorted(
+            (name, tuple(values)) for name, values in query.items())))
+        response = self.cache.get(key)
+        if response is None:
+            response = self.route(store, path, query)
+            self.cache.put(key, response)
+        return response
+
+    def route(self, store, path, query):
+        parts = [unquote(part) for part in path.strip('/').split('/')]
+        if parts == ['champions']:
+            return self.ok(OrderedDict(
+                (champion, record['champ_id'])
+                for champion, record in store.corpus.items()))
+        if len(parts) == 2 and parts[0] == 'quotes':
+            return self.lookup(store, parts[1], first(query, 'category'))
+        if len(parts) == 2 and parts[0] == 'categories':
+            entries = store.by_category.get(category_key(parts[1]), [])
+            result = OrderedDict()
+            for champion, h2, quote_id, quote in entries:
+                result.setdefault(champion, OrderedDict())[quote_id] = quote
+            return self.ok(result) if result else \
+                self.error(404, "No category " + parts[1])
+        if parts == ['search']:
+            return self.search(store, query)
+        return self.error(404, "Unknown path " + path)
+
+    def lookup(self, store, name_or_id, category):
+        champion = store.champion(name_or_id)
+        if champion is None:
+            return self.error(404, "No champion " + name_or_id)
+        if category is None:
+            return self.ok({champion: store.corpus[champion]})
+        categories = store.categories(champion, category)
+        if not categories:
+            return self.error(404, "{} has no category {}"
+                              .format(champion, category))
+        quotes = OrderedDict()
+        for _, category_quotes in categories:
+            quotes.update(category_quotes)
+        return self.ok(quotes)
+
+    def random_quote(self, store, query):
+        champion = first(query, 'champion')
+        if champion is not None:
+            name = store.champion(champion)
+            if name is None:
+                return self.error(404, "No champion " + champion)
+            champion = name
+        pool = store.pool(champion, first(query, 'category'))
+        if not pool:
+            return self.error(404, "No quotes match")
+        champion, h2, quote_id, quote = random.choice(pool)
+        return self.ok(OrderedDict([('champion', champion),
+                                    ('category', h2),
+                                    ('quote_id', quote_id),
+                                    ('quote', quote)]))
+
+    def search(self, store, query):
+        text = first(query, 'q')
+        if not text:
+            return self.error(400, "Missing q")
+        champion = first(query, 'champion')
+        if champion is not None:
+            champion = store.champion(champion) or champion
+        try:
+            k = int(first(query, 'k', 10))
+        except ValueError:
+            return self.error(400, "k must be an integer")
+        return self.ok(store.search_index.search(
+            text, champion, first(query, 'category'), k))
+
+    @staticmethod
+    def ok(data):
+        return 200, json.dumps(data).encode('utf-8')
+
+    @staticmethod
+    def error(status, message):
+        return status, json.dumps({'error': message}).encode('utf-8')
+
+
+def first(query, name, default=None):
+    values = query.get(name)
+    return values[0] if values else default
+
+
+class QuoteHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive, for clients that reuse.
+    disable_nagle_algorithm = True
+    service = None  # Set by serve().
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        status, body = self.service.handle(url.path, parse_qs(url.query))
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class QuoteHTTPServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+    # Room for many bots connecting at once. With the default of 5, the
+    # rest wait a second for their SYN to be retried.
+    request_queue_size = 128
+
+
+def make_server(service, host='127.0.0.1', port=8000):
+    handler = type('Handler', (QuoteHandler,), {'service': service})
+    return QuoteHTTPServer((host, port), handler)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve exported quotes over HTTP. Endpoints:"
+        " /champions, /quotes/<champion or ID>[?category=],"
+        " /categories/<h2>, /random[?champion=&category=],"
+        " /search?q=[&champion=&category=&k=].")
+    parser.add_argument('export', nargs='?', help="Export to serve."
+                        " Defaults to 'quotes_list_export.json'.",
+                        default='quotes_list_export.json')
+    parser.add_argument("--host", help="Defaults to 127.0.0.1.",
+                        default='127.0.0.1')
+    parser.add_argument("--port", help="Defaults to 8000.", type=int,
+                        default=8000)
+    parser.add_argument("--cache-size", help="Responses kept in the LRU"
+                        " cache. Defaults to 1024.", type=int, default=1024)
+    parser.add_argument("--reload-interval", help="Seconds between checks"
+                        " for a changed export, or 0 to never reload."
+                        " Defaults to 1.",
+                        type=float, default=1.0)
+    args = parser.parse_args()
+
+    service = QuoteService(args.export, args.cache_size, args.reload_interval)
+    server = make_server(service, args.host, args.port)
+    print("Serving", len(service.store.corpus), "champions from",
+          args.export, "on http://{}:{}".format(*server.server_address[:2]))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import suppress
+
+# Suffix of the temporary files that write_atomic() renames into place.
+# Eviction leaves them to the writer, unless they are older than
+# STALE_TMP seconds, left behind by a crash.
+TMP_SUFFIX = '.tmp'
+STALE_TMP = 3600
+
+
+class ResponseCache:
+    # Layout of the cache directory:
+    #   entries/<sha256 of url>.json  -> url, validators and body hash
+    #   bodies/<sha256 of body>       -> page body, shared by every url
+    #                                    that returned the same content
+    # Several processes may share a directory, e.g. shard workers, so a
+    # file can disappear under any of them.
+    def __init__(self, directory='.http_cache', ttl=7 * 24 * 3600,
+                 max_size=200 * 1024 * 1024):
+        self.directory = directory
+        # Seconds since last validation before eviction, or None to keep
+        # entries however old, e.g. to replay them offline.
+        self.ttl = ttl
+        # Bytes of bodies kept on disk, or None for no limit.
+        self.max_size = max_size
+        self.size = 0  # Bytes of bodies, as of the last evict() and since
+        self.lock = threading.Lock()
+        self.entry_dir = os.path.join(directory, 'entries')
+        self.body_dir = os.path.join(directory, 'bodies')
+        os.makedirs(self.entry_dir, exist_ok=True)
+        os.makedirs(self.body_dir, exist_ok=True)
+        self.evict()
+
+    @staticmethod
+    def digest(data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        return hashlib.sha256(data).hexdigest()
+
+    def entry_path(self, url):
+        return os.path.join(self.entry_dir, self.digest(url) + '.json')
+
+    def body_path(self, body_hash):
+        return os.path.join(self.body_dir, body_hash)
+
+    def write_atomic(self, path, data):
+        # Write to a temporary file first so that concurrent readers,
+        # or a crash mid-write, never leave a truncated file behind.
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path),
+                                   suffix=TMP_SUFFIX)
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            with suppress(FileNotFoundError):
+                os.unlink(tmp)
+            raise
+
+    def get(self, url):
+        try:
+            with open(self.entry_path(url), 'r') as file:
+                entry = json.load(file)
+            with open(self.body_path(entry['body']), 'rb') as file:
+                body = file.read()
+        except (FileNotFoundError, json.decoder.JSONDecodeError, KeyError):
+            return None
+        return entry, body
+
+    def validators(self, entry):
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def store(self, url, headers, body):
+        body_hash = self.digest(body)
+        path = self.body_path(body_hash)
+        if not os.path.exists(path):
+            self.write_atomic(path, body)
+            with self.lock:
+                self.size += len(body)
+        entry = {
+            'url': url,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'body': body_hash,
+            'validated': time.time(),
+        }
+        self.write_atomic(self.entry_path(url),
+                          json.dumps(entry).encode('utf-8'))
+        if self.max_size and self.size > self.max_size:
+            # Down to 90%, so that a full cache isn't rescanned for
+            # every page stored.
+            self.evict(self.max_size * 0.9)
+
+    def touch(self, url, entry):
+        entry['validated'] = time.time()
+        self.write_atomic(self.entry_path(url),
+                          json.dumps(entry).encode('utf-8'))
+
+    def evict(self, max_size=None):
+        with self.lock:
+            self.evict_unlocked(max_size or self.max_size)
+
+    def evict_temporary(self, path, now):
+        # Whether path is a temporary file, removing it if it is stale.
+        if not path.endswith(TMP_SUFFIX):
+            return False
+        with suppress(FileNotFoundError):
+            if now - os.path.getmtime(path) > STALE_TMP:
+                os.unlink(path)
+        return True
+
+    def evict_unlocked(self, max_size):
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.entry_dir):
+            path = os.path.join(self.entry_dir, name)
+            if self.evict_temporary(path, now):
+                continue
+            try:
+                with open(path, 'r') as file:
+                    entry = json.load(file)
+            except FileNotFoundError:
+                continue
+            except (OSError, json.decoder.JSONDecodeError):
+                entry = None
+            if (entry is None or
+                    (self.ttl and now - entry['validated'] > self.ttl)):
+                with suppress(FileNotFoundError):
+                    os.unlink(path)
+            else:
+                entries.append((entry['validated'], path, entry['body']))
+        # Evict the least recently validated entries until the bodies
+        # they reference fit within max_size.
+        entries.sort(reverse=True)
+        sizes = {}
+        for name in os.listdir(self.body_dir):
+            path = os.path.join(self.body_dir, name)
+            if self.evict_temporary(path, now):
+                continue
+            with suppress(FileNotFoundError):
+                sizes[name] = os.path.getsize(path)
+        kept, total = set(), 0
+        for _, path, body_hash in entries:
+            size = 0 if body_hash in kept else sizes.get(body_hash, 0)
+            if max_size and total + size > max_size:
+                with suppress(FileNotFoundError):
+                    os.unlink(path)
+                continue
+            kept.add(body_hash)
+            total += size
+        for name in sizes:
+            if name not in kept:
+                with suppress(FileNotFoundError):
+                    os.unlink(os.path.join(self.body_dir, name))
+        self.size = total
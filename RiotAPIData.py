@@ -1,13 +1,32 @@
+import argparse
 import json
-from riotwatcher import RiotWatcher
+import os
+import time
+from contextlib import suppress
+from ChampionIndex import invalidate_champion_table
+with suppress(ImportError):
+    from riotwatcher import RiotWatcher
+
+# Live version last seen for each region, and when it was checked.
+VERSION_MANIFEST = 'riot_versions.json'
 
 
 class RiotAPIData:
-    def __init__(self, args=None, my_region='na1'):
+    # With api_url, the static-data endpoints are requested from that
+    # base URL (e.g. a local stand-in) instead of through riotwatcher.
+    def __init__(self, args=None, my_region='na1', api_url=None,
+                 ttl=24 * 3600, manifest=VERSION_MANIFEST, fetcher=None):
         self.args = args  # Print hidden exceptions if args.e
         self.my_region = my_region
+        self.api_url = api_url
+        self.ttl = ttl  # Seconds a checked live version is trusted
+        self.manifest = manifest
         self.key = self.get_key()
-        self.watcher = RiotWatcher(self.key)
+        if api_url is None:
+            self.watcher = RiotWatcher(self.key)
+        else:
+            from Fetcher import Fetcher
+            self.fetcher = fetcher if fetcher is not None else Fetcher(args)
 
     def get_key(self):
         try:
@@ -31,7 +50,40 @@ class RiotAPIData:
                   "Riot API key in the 'riot_api_key.json' file.")
             return None
 
-    def check_versions(self):
+    def static_data(self, endpoint, **params):
+        if self.api_url is None:
+            method = getattr(self.watcher.static_data, endpoint)
+            return method(self.my_region, **params)
+        query = '&'.join('{}={}'.format(key, str(value).lower())
+                         for key, value in params.items())
+        url = '{}/lol/static-data/v3/{}'.format(self.api_url.rstrip('/'),
+                                                endpoint)
+        body = self.fetcher.request(
+            url + ('?' + query if query else ''),
+            {'X-Riot-Token': self.key or ''})[3]
+        return json.loads(body.decode('utf-8'))
+
+    def load_manifest(self):
+        try:
+            with open(self.manifest, 'r') as file:
+                return json.load(file)
+        except (FileNotFoundError, json.decoder.JSONDecodeError):
+            return {}
+
+    def live_version(self, refresh=False):
+        # From the manifest while it is younger than the TTL, so that
+        # repeated runs make no request at all.
+        manifest = self.load_manifest()
+        entry = manifest.get(self.my_region)
+        if (not refresh and entry is not None and
+                time.time() - entry['checked'] < self.ttl):
+            return entry['live']
+        live = self.static_data('versions')[0]
+        manifest[self.my_region] = {'live': live, 'checked': time.time()}
+        write_json_atomic(manifest, self.manifest)
+        return live
+
+    def check_versions(self, refresh=False):
         versions = {}
         try:
             with open('name_id_dict.json', 'r') as file:
@@ -39,38 +91,97 @@ class RiotAPIData:
         except FileNotFoundError:
             versions['local'] = None
         try:
-            versions['live'] = \
-                self.watcher.static_data.versions(self.my_region)[0]
+            versions['live'] = self.live_version(refresh)
         except Exception as e:
-            if e.response.status_code == 401:
+            # requests' HTTPError (riotwatcher) or urllib's (api_url).
+            status = getattr(getattr(e, 'response', None), 'status_code',
+                             getattr(e, 'code', None))
+            if status == 401:
                 print("No API key was supplied. Get a new key from:",
                       "https://developer.riotgames.com")
-            if e.response.status_code == 403:
+            if status == 403:
                 print("Invalid API key. Get a new key from:",
                       "https://developer.riotgames.com")
-            if self.args.e:
+            if self.args is not None and self.args.e:
                 print(e)
             versions['live'] = None
         return versions
 
     def download_champ_data(self):
-        champions_data = \
-            self.watcher.static_data.champions(self.my_region, data_by_id=True)
-        id_list = name_list = []
-        id_list = sorted(champions_data['data'], key=lambda e: int(e))
-        # Remove and re-add 'data' to the dict so that 'type' and
-        # 'version' are at the top of the dict.
-        champions_data['data'] = champions_data.pop('data')
-        for key in id_list:
-            champions_data['data'][key] = champions_data['data'].pop(key)
-            del champions_data['data'][key]['key']
-            del champions_data['data'][key]['title']
-            name_list.append(champions_data['data'][key]['name'])
-
-        with open('name_id_dict.json', 'w') as file:
-            json.dump(champions_data, file, indent=4)
+        # Merges the live champion list into name_id_dict.json: only
+        # added, renamed and removed champions change, and the file is
+        # rewritten only if something did (the version included).
+        # Returns {'added': [...], 'renamed': [...], 'removed': [...]}.
+        champions_data = self.static_data('champions', data_by_id=True)
+        try:
+            with open('name_id_dict.json', 'r') as file:
+                local = json.load(file)
+        except (FileNotFoundError, json.decoder.JSONDecodeError):
+            local = {'data': {}}
+        changes = {'added': [], 'renamed': [], 'removed': []}
+        data = local['data']
+        for key in sorted(champions_data['data'], key=lambda e: int(e)):
+            live = champions_data['data'][key]
+            if key not in data:
+                changes['added'].append(live['name'])
+            elif data[key]['name'] != live['name']:
+                changes['renamed'].append(
+                    '{} -> {}'.format(data[key]['name'], live['name']))
+            else:
+                continue
+            data[key] = {'id': live['id'], 'name': live['name']}
+        for key in [key for key in data
+                    if key not in champions_data['data']]:
+            changes['removed'].append(data.pop(key)['name'])
+        if not any(changes.values()) and \
+                local.get('version') == champions_data['version']:
+            return changes
+        # 'type' and 'version' at the top of the dict, then the
+        # champions by ID.
+        write_json_atomic({
+            'type': champions_data['type'],
+            'version': champions_data['version'],
+            'data': {key: data[key]
+                     for key in sorted(data, key=lambda e: int(e))},
+        }, 'name_id_dict.json', indent=4)
+        # Readers in this process pick up the new champion list.
+        invalidate_champion_table('name_id_dict.json')
+        return changes
+
+
+def write_json_atomic(data, path, indent=None):
+    # Readers see the old file or the new one, never a partial write.
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as file:
+        json.dump(data, file, indent=indent)
+    os.replace(tmp, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Sync name_id_dict.json with the live champion list.")
+    parser.add_argument("--api-url", help="Base URL of the static-data API,"
+                        " e.g. a local stand-in. Defaults to Riot's, through"
+                        " riotwatcher.")
+    parser.add_argument("--ttl", help="Hours a checked live version is"
+                        " trusted before asking again. Defaults to 24.",
+                        type=float, default=24)
+    parser.add_argument("--refresh", help="Check the live version even if"
+                        " the manifest is fresh.", action='store_true')
+    parser.add_argument("-e", help="Print exceptions for error reporting.",
+                        action='store_true')
+    args = parser.parse_args()
+
+    riot_api_data = RiotAPIData(args, api_url=args.api_url,
+                                ttl=args.ttl * 3600)
+    versions = riot_api_data.check_versions(args.refresh)
+    print("Local version:\t{}".format(versions['local']))
+    print("Live version:\t{}".format(versions['live']))
+    if versions['live'] is not None and versions['local'] != versions['live']:
+        changes = riot_api_data.download_champ_data()
+        for kind, names in changes.items():
+            print(kind.capitalize() + ":", ", ".join(names) or "-")
 
 
 if __name__ == "__main__":
-    riot_api_data = RiotAPIData()
-    riot_api_data.download_champ_data()
+    main()
@@ -0,0 +1,113 @@
+import json
+import os
+from collections import OrderedDict
+
+VERSION = 1
+
+
+class ScrapeJournal:
+    # Append-only progress journal of a scrape-all run, one JSON line
+    # per finished champion:
+    #   {"champion": ..., "revid": ..., "record": {...}}
+    # after a header line with the settings the records depend on. A
+    # restarted run skips the champions whose page revision is still
+    # the journaled one, and compact() turns the journal into the
+    # export once every champion is done.
+    # Records of champions in `metrics.failures` are never journaled, so
+    # that they are scraped again.
+    def __init__(self, path, settings, revisions=None, metrics=None):
+        self.path = path
+        self.settings = dict(settings, journal=VERSION)
+        self.revisions = revisions or {}  # champion -> {'revid': ...}
+        self.metrics = metrics
+        self.entries = {}  # champion -> (offset, revid)
+        self.resumed = self.load()
+        self.file = open(path, 'a' if self.resumed else 'w')
+        if not self.resumed:
+            self.file.write(json.dumps(self.settings) + '\n')
+            self.file.flush()
+
+    def load(self):
+        # Reads the entries of an existing journal made with the same
+        # settings. The journal is cut at the first line that is short
+        # or corrupt, e.g. from a torn write that a later run appended
+        # to, so those champions are scraped again.
+        try:
+            file = open(self.path, 'r+')
+        except FileNotFoundError:
+            return False
+        with file:
+            try:
+                if json.loads(file.readline()) != self.settings:
+                    return False
+            except ValueError:
+                return False
+            offset = file.tell()
+            for line in iter(file.readline, ''):
+                try:
+                    if not line.endswith('\n'):
+                        raise ValueError("Incomplete line")
+                    entry = json.loads(line)
+                    champion, revid = entry['champion'], entry['revid']
+                    if 'quotes' not in entry['record']:
+                        raise KeyError('quotes')
+                except (ValueError, KeyError, TypeError):
+                    file.truncate(offset)
+                    break
+                self.entries[champion] = (offset, revid)
+                offset = file.tell()
+        return True
+
+    def revid(self, champion):
+        revision = self.revisions.get(champion)
+        return revision['revid'] if revision else None
+
+    def is_done(self, champion):
+        # Journaled, and the page hasn't changed since. Without a
+        # current revision to compare, the journal is trusted.
+        if champion not in self.entries:
+            return False
+        current = self.revid(champion)
+        return current is None or self.entries[champion][1] == current
+
+    def write(self, base_dict):
+        for champion, record in base_dict.items():
+            if (self.metrics is not None and
+                    champion in self.metrics.failures):
+                continue
+            offset = self.file.tell()
+            revid = self.revid(champion)
+            self.file.write(json.dumps({'champion': champion, 'revid': revid,
+                                        'record': record}) + '\n')
+            self.entries[champion] = (offset, revid)
+        self.file.flush()
+
+    def compact(self, writer, champions):
+        # Writes every (champion, champ_id) to the export writer in
+        # roster order. Champions missing from the journal, e.g. those
+        # that failed, get an empty record.
+        self.file.flush()
+        with open(self.path, 'r') as file:
+            for champion, champ_id in champions:
+                if champion in self.entries:
+                    file.seek(self.entries[champion][0])
+                    record = json.loads(file.readline(),
+                                        object_pairs_hook=OrderedDict)
+                    record = record['record']
+                else:
+                    record = OrderedDict([('champ_id', champ_id),
+                                          ('quotes', OrderedDict())])
+                writer.write(OrderedDict([(champion, record)]))
+
+    def close(self):
+        self.file.close()
+
+    def remove(self):
+        self.close()
+        os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,247 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+VERSION = 2
+# Task states. A leased task whose lease has expired can be claimed
+# again, by any worker.
+TODO, LEASED, DONE, FAILED = 'todo', 'leased', 'done', 'failed'
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)",
+    "CREATE TABLE IF NOT EXISTS tasks ("
+    " position INTEGER PRIMARY KEY,"  # Roster order
+    " champion TEXT NOT NULL UNIQUE,"
+    " champ_id INTEGER NOT NULL,"
+    " state TEXT NOT NULL,"
+    " owner TEXT,"  # Worker holding or last holding the lease
+    " expires REAL,"  # When the lease runs out, in time.time()
+    " attempts INTEGER NOT NULL DEFAULT 0,"
+    " not_before REAL,"  # A failed task waits until then to be retried
+    " error TEXT,"  # Of the last failed attempt
+    " record TEXT)",  # JSON of {'champ_id', 'quotes'}
+)
+
+
+def worker_name():
+    return '{}:{}'.format(socket.gethostname(), os.getpid())
+
+
+class ShardQueue:
+    # Work queue of a sharded scrape-all run, in an SQLite file that
+    # every worker opens: several processes on one machine, or hosts
+    # sharing a directory. Each champion of the roster is a task, in
+    # roster order:
+    #   claim()    -> leases the next free task to this worker for
+    #                 `lease` seconds; heartbeat() keeps renewing them
+    #   complete() -> stores the record if the lease is still ours, or
+    #                 puts a failed task back until it has had
+    #                 `attempts` tries; it waits `backoff` seconds,
+    #                 doubling with each try, before it can be claimed
+    #   merge()    -> writes every record to an ExportWriter in roster
+    #                 order, so the export is the same whichever worker
+    #                 scraped what
+    # Leases of a worker that died expire and are claimed by the others.
+    # Lease times are wall-clock, so hosts need synchronized clocks.
+    # A queue with other settings is started over. One already merged
+    # is left as it is (`merged` is set) so that workers joining late
+    # don't scrape everything again, unless it has failures, which are
+    # retried. With reset=True, a merged queue is started over; one
+    # still in progress is joined either way.
+    def __init__(self, path, champions, settings, lease=60, attempts=3,
+                 backoff=10, worker=None, metrics=None, reset=False):
+        self.path = path
+        self.reset = reset
+        self.merged = False
+        self.lease = lease
+        self.attempts = attempts
+        self.backoff = backoff
+        self.worker = worker or worker_name()
+        self.metrics = metrics
+        settings = dict(settings, shard_queue=VERSION,
+                        roster=[champion for champion, _ in champions])
+        with self.transaction() as db:
+            for statement in SCHEMA:
+                db.execute(statement)
+            self.setup(db, json.dumps(settings, sort_keys=True), champions)
+
+    def setup(self, db, settings, champions):
+        meta = dict(db.execute("SELECT key, value FROM meta"))
+        failed = db.execute("SELECT COUNT(*) FROM tasks WHERE state = ?",
+                            (FAILED,)).fetchone()[0]
+        same = meta.get('settings') == settings
+        if same and not meta.get('merged'):
+            self.resumed = True
+            return
+        if same and not self.reset and not failed:
+            self.resumed = self.merged = True
+            return
+        if same and not self.reset:
+            db.execute("UPDATE tasks SET state = ?, attempts = 0, error ="
+                       " NULL, record = NULL, not_before = NULL WHERE"
+                       " state = ?", (TODO, FAILED))
+        else:
+            # Recreated rather than emptied, in case it is from an older
+            # version of the queue, with other columns.
+            db.execute("DROP TABLE tasks")
+            db.execute(SCHEMA[1])
+            db.executemany(
+                "INSERT INTO tasks (position, champion, champ_id, state)"
+                " VALUES (?, ?, ?, ?)",
+                [(position, champion, champ_id, TODO)
+                 for position, (champion, champ_id) in enumerate(champions)])
+        db.execute("INSERT OR REPLACE INTO meta VALUES ('settings', ?)",
+                   (settings,))
+        db.execute("DELETE FROM meta WHERE key = 'merged'")
+        self.resumed = False
+
+    @contextmanager
+    def transaction(self):
+        # A connection per transaction, so that any thread can use the
+        # queue. BEGIN IMMEDIATE takes the write lock up front; other
+        # workers wait for it for up to a minute.
+        db = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+        finally:
+            db.close()
+
+    def count(self, name):
+        if self.metrics is not None:
+            self.metrics.count(name)
+
+    def claim(self):
+        # The next free (champion, champ_id), or None. Failed tasks
+        # still backing off aren't free yet.
+        now = time.time()
+        with self.transaction() as db:
+            task = db.execute(
+                "SELECT position, champion, champ_id, state FROM tasks"
+                " WHERE (state = ? AND (not_before IS NULL OR"
+                " not_before <= ?)) OR (state = ? AND expires < ?)"
+                " ORDER BY position LIMIT 1",
+                (TODO, now, LEASED, now)).fetchone()
+            if task is None:
+                return None
+            db.execute("UPDATE tasks SET state = ?, owner = ?, expires = ?,"
+                       " attempts = attempts + 1 WHERE position = ?",
+                       (LEASED, self.worker, now + self.lease, task[0]))
+        if task[3] == LEASED:
+            self.count('shard_reclaimed')
+        return task[1], task[2]
+
+    def claims(self):
+        # Claims tasks one at a time, as they are read, until none are
+        # free.
+        for task in iter(self.claim, None):
+            yield task
+
+    def renew(self):
+        with self.transaction() as db:
+            db.execute("UPDATE tasks SET expires = ? WHERE owner = ? AND"
+                       " state = ?",
+                       (time.time() + self.lease, self.worker, LEASED))
+
+    def release(self):
+        # Puts back the tasks this worker still holds, e.g. when it is
+        # stopped, so that they don't wait for their leases to expire.
+        with self.transaction() as db:
+            db.execute("UPDATE tasks SET state = ?, owner = NULL, expires ="
+                       " NULL, attempts = attempts - 1 WHERE owner = ? AND"
+                       " state = ?", (TODO, self.worker, LEASED))
+
+    @contextmanager
+    def heartbeat(self):
+        # Renews this worker's leases every third of a lease while the
+        # block runs, so slow pages aren't taken over.
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(self.lease / 3):
+                self.renew()
+        thread = threading.Thread(target=beat, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def complete(self, champion, record, error=None):
+        # Stores the record of a leased task, or with an error, puts the
+        # task back for another try after the backoff. Returns False if
+        # the lease was lost to another worker, whose result is kept
+        # instead.
+        with self.transaction() as db:
+            task = db.execute("SELECT attempts FROM tasks WHERE champion = ?"
+                              " AND owner = ? AND state = ?",
+                              (champion, self.worker, LEASED)).fetchone()
+            if task is None:
+                lost = True
+            elif error is not None and task[0] < self.attempts:
+                lost = False
+                db.execute("UPDATE tasks SET state = ?, owner = NULL,"
+                           " expires = NULL, error = ?, not_before = ?"
+                           " WHERE champion = ?",
+                           (TODO, error, time.time() + self.backoff *
+                            2 ** (task[0] - 1), champion))
+            else:
+                lost = False
+                db.execute("UPDATE tasks SET state = ?, expires = NULL,"
+                           " error = ?, record = ? WHERE champion = ?",
+                           (DONE if error is None else FAILED, error,
+                            json.dumps(record), champion))
+        if lost:
+            self.count('shard_lost')
+        return not lost
+
+    def progress(self):
+        # Tasks by state.
+        with self.transaction() as db:
+            counts = dict(db.execute("SELECT state, COUNT(*) FROM tasks"
+                                     " GROUP BY state"))
+        return OrderedDict((state, counts.get(state, 0))
+                           for state in (TODO, LEASED, DONE, FAILED))
+
+    def finish(self):
+        # Once every task is done or failed, the first worker to ask
+        # becomes the one that merges; True for that worker only.
+        with self.transaction() as db:
+            left = db.execute("SELECT COUNT(*) FROM tasks WHERE state IN"
+                              " (?, ?)", (TODO, LEASED)).fetchone()[0]
+            if left or db.execute("SELECT value FROM meta WHERE key ="
+                                  " 'merged'").fetchone() is not None:
+                return False
+            db.execute("INSERT INTO meta VALUES ('merged', ?)",
+                       (self.worker,))
+            return True
+
+    def is_finished(self):
+        progress = self.progress()
+        return not progress[TODO] and not progress[LEASED]
+
+    def merge(self, writer):
+        with self.transaction() as db:
+            tasks = db.execute("SELECT champion, record FROM tasks ORDER BY"
+                               " position").fetchall()
+        for champion, record in tasks:
+            writer.write(OrderedDict([(champion, json.loads(
+                record, object_pairs_hook=OrderedDict))]))
+
+    def failures(self):
+        # champion -> error, for the tasks that failed every attempt.
+        with self.transaction() as db:
+            return OrderedDict(db.execute(
+                "SELECT champion, error FROM tasks WHERE state = ? ORDER BY"
+                " position", (FAILED,)))
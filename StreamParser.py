@@ -0,0 +1,152 @@
+from collections import Counter, deque
+from html.parser import HTMLParser
+
+
+# Elements that never have children. BeautifulSoup closes these as soon
+# as they open, and ignores their end tags.
+VOID_TAGS = {
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen',
+    'link', 'menuitem', 'meta', 'param', 'source', 'track', 'wbr',
+}
+# Tags whose Scraper handlers read tag.text. Their handlers can only be
+# called once the tag closes, and every tag after them waits its turn
+# so that handlers still run in document order.
+TEXT_TAGS = {'h2', 'a', 'li', 'i'}
+
+
+class StreamTag:
+    # Stands in for the BeautifulSoup Tag passed to the Scraper handlers.
+    def __init__(self, name, attrs, index):
+        self.name = name
+        self.attrs = dict(attrs)
+        self.index = index  # Position in document order
+        self.end_index = None  # Last index inside this tag, once closed
+        self.text = ''
+        self.text_start = 0
+
+    def get(self, key, default=None):
+        return self.attrs.get(key, default)
+
+    @property
+    def closed(self):
+        return self.end_index is not None
+
+
+class StopParsing(Exception):
+    pass
+
+
+class StreamParser(HTMLParser):
+    # Feeds start/end/text events from a page straight into a Scraper's
+    # func_dict handlers, without building a document tree. Only the
+    # tags inside an unfinished h2/a/li/i are held in memory.
+    # Produces the same calls, in the same order, as
+    # populate_dictionary() over div#mw-content-text, including the
+    # second pass over the Classic / Live tab.
+    def __init__(self, scraper):
+        super().__init__(convert_charrefs=True)
+        self.scraper = scraper
+        self.in_content = False
+        self.stack = []  # Open StreamTags, innermost last
+        self.pending = deque()  # StreamTags waiting for their handler call
+        self.chunks = []  # Text of the open TEXT_TAGS
+        self.open_text_tags = 0
+        self.count = 0
+        self.scope = None  # The Classic / Live tab div, once found
+        self.handler_calls = Counter()  # func_dict name or 'default' -> calls
+
+    def parse(self, page):
+        if isinstance(page, bytes):
+            try:
+                page = page.decode('utf-8')
+            except UnicodeDecodeError:
+                page = page.decode('windows-1252', 'replace')
+        self.scraper.found_classic = False
+        try:
+            self.feed(page)
+            self.close()
+            self.close_tags(0)
+        except StopParsing:
+            pass
+
+    def handle_starttag(self, name, attrs):
+        if not self.in_content:
+            if name == 'div' and dict(attrs).get('id') == 'mw-content-text':
+                self.in_content = True
+            return
+        tag = StreamTag(name, attrs, self.count)
+        self.count += 1
+        self.pending.append(tag)
+        if name in VOID_TAGS:
+            tag.end_index = tag.index
+        else:
+            if name in TEXT_TAGS:
+                tag.text_start = len(self.chunks)
+                self.open_text_tags += 1
+            self.stack.append(tag)
+        self.dispatch()
+
+    def handle_startendtag(self, name, attrs):
+        self.handle_starttag(name, attrs)
+        if name not in VOID_TAGS and self.in_content and self.stack:
+            self.handle_endtag(name)
+
+    def handle_endtag(self, name):
+        if not self.in_content:
+            return
+        # Like BeautifulSoup, close the most recent open tag with this
+        # name along with everything opened after it, or ignore a stray
+        # end tag.
+        for i in range(len(self.stack) - 1, -1, -1):
+            if self.stack[i].name == name:
+                self.close_tags(i)
+                return
+        if name == 'div':
+            # End of div#mw-content-text, which closes everything in it.
+            self.close_tags(0)
+            raise StopParsing
+
+    def close_tags(self, i):
+        for tag in reversed(self.stack[i:]):
+            tag.end_index = self.count - 1
+            if tag.name in TEXT_TAGS:
+                tag.text = ''.join(self.chunks[tag.text_start:])
+                self.open_text_tags -= 1
+        del self.stack[i:]
+        if not self.open_text_tags:
+            self.chunks = []
+        self.dispatch()
+
+    def handle_data(self, data):
+        if self.in_content and self.open_text_tags:
+            self.chunks.append(data)
+
+    def dispatch(self):
+        scraper = self.scraper
+        while self.pending:
+            tag = self.pending[0]
+            if tag.name in TEXT_TAGS and not tag.closed:
+                return
+            self.pending.popleft()
+            if self.scope is not None and self.scope.closed and \
+                    tag.index > self.scope.end_index:
+                # Past the end of the Classic / Live tab.
+                raise StopParsing
+            handler = scraper.func_dict.get(tag.name)
+            if handler is None:
+                self.handler_calls['default'] += 1
+                handler = scraper.handle_default
+            else:
+                self.handler_calls[tag.name] += 1
+            handler(tag)
+            if scraper.found_classic:
+                if self.scope is not None:
+                    # populate_dictionary() would stop its second pass
+                    # here, and it is never called a third time.
+                    raise StopParsing
+                # Continue with the tab's contents only, as the second
+                # populate_dictionary() pass does.
+                self.scope = tag
+                scraper.found_classic = False
+        if self.scope is not None and self.scope.closed:
+            raise StopParsing
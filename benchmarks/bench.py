@@ -0,0 +1,645 @@
+import argparse
+import functools
+import http.server
+import json
+import os
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote, urlsplit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, HERE)
+
+import fixtures  # noqa: E402
+import wiki  # noqa: E402
+from bs4 import BeautifulSoup  # noqa: E402
+from AudioDownload import AudioDownloader  # noqa: E402
+from ExportWriter import ExportWriter  # noqa: E402
+from Fetcher import Fetcher  # noqa: E402
+from ResponseCache import ResponseCache  # noqa: E402
+from ShardQueue import ShardQueue  # noqa: E402
+
+BASELINE = os.path.join(HERE, 'baseline.json')
+# Modules (and their submodules) a read-only query must never import.
+HEAVY_MODULES = ('bs4', 'riotwatcher', 'RiotAPIData', 'multiprocessing',
+                 'asyncio', 'http.client', 'ssl', 'sqlite3',
+                 'concurrent.futures')
+
+
+class WikiHandler(http.server.BaseHTTPRequestHandler):
+    # Serves the recorded fixtures as /wiki/<Champion>/Quotes, with
+    # keep-alive and validators like the real wiki.
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are separate writes; without this, Nagle's
+    # algorithm and delayed ACKs add ~40 ms to every keep-alive request.
+    disable_nagle_algorithm = True
+
+    def __init__(self, pages, *args, **kwargs):
+        self.pages = pages
+        super().__init__(*args, **kwargs)
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        path = unquote(urlsplit(self.path).path)
+        champion = None
+        if path.startswith('/wiki/') and path.endswith('/Quotes'):
+            champion = path[len('/wiki/'):-len('/Quotes')].replace('_', ' ')
+        body = self.pages.get(champion)
+        if body is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        etag = '"{:x}"'.format(hash(body) & 0xffffffff)
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StandInWiki:
+    def __init__(self, pages):
+        handler = functools.partial(WikiHandler, pages)
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0),
+                                                      handler)
+        self.server.daemon_threads = True
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class RiotHandler(http.server.BaseHTTPRequestHandler):
+    # The two static-data endpoints RiotAPIData uses. Counts requests.
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def __init__(self, riot, *args, **kwargs):
+        self.riot = riot
+        super().__init__(*args, **kwargs)
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        self.riot.requests.append(path)
+        body, status = None, 200
+        if not self.headers.get('X-Riot-Token'):
+            status = 401
+        elif path == '/lol/static-data/v3/versions':
+            body = [self.riot.version]
+        elif path == '/lol/static-data/v3/champions':
+            body = self.riot.champions()
+        else:
+            status = 404
+        data = json.dumps(body).encode('utf-8') if body is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class StandInRiot(StandInWiki):
+    def __init__(self, version, names):
+        self.version = version
+        self.names = names  # champ_id -> name
+        self.requests = []
+        self.server = http.server.ThreadingHTTPServer(
+            ('127.0.0.1', 0), functools.partial(RiotHandler, self))
+        self.server.daemon_threads = True
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       daemon=True)
+
+    def champions(self):
+        return {
+            'type': 'champion',
+            'version': self.version,
+            'data': {str(champ_id): {'id': champ_id, 'key': name,
+                                     'name': name, 'title': 'the Stand-In'}
+                     for champ_id, name in self.names.items()},
+        }
+
+
+class AudioHandler(http.server.BaseHTTPRequestHandler):
+    # Serves /files/<name> with Range support. Names in `cut` lose their
+    # connection a third of the way through, the first time only.
+    # Records the (name, Range header) of every request.
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def __init__(self, audio, *args, **kwargs):
+        self.audio = audio
+        super().__init__(*args, **kwargs)
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        name = urlsplit(self.path).path[len('/files/'):]
+        self.audio.requests.append((name, self.headers.get('Range')))
+        body = self.audio.files.get(name)
+        if body is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        start = 0
+        if self.headers.get('Range'):
+            start = int(self.headers['Range'][len('bytes='):-1])
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(
+                start, len(body) - 1, len(body)))
+        else:
+            self.send_response(200)
+        part = body[start:]
+        self.send_header('Content-Length', str(len(part)))
+        self.end_headers()
+        if name in self.audio.cut:
+            self.audio.cut.discard(name)
+            self.wfile.write(part[:len(part) // 3])
+            self.wfile.flush()
+            self.close_connection = True
+            self.connection.shutdown(socket.SHUT_RDWR)
+            return
+        self.wfile.write(part)
+
+
+class StandInAudio(StandInWiki):
+    def __init__(self, files, cut):
+        self.files = files  # name -> body
+        self.cut = set(cut)
+        self.requests = []
+        self.server = http.server.ThreadingHTTPServer(
+            ('127.0.0.1', 0), functools.partial(AudioHandler, self))
+        self.server.daemon_threads = True
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       daemon=True)
+
+
+def timed(func, repeat):
+    # Best of `repeat` runs, in seconds, and the last result.
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def bench_fetch(url, champions, workers):
+    fetcher = Fetcher(per_host=workers, rate=0)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pages = list(pool.map(
+            lambda champ: fetcher.fetch(wiki.quotes_url(champ, url)),
+            champions))
+    fetcher.close()
+    return pages
+
+
+def bench_parse(pages):
+    return [BeautifulSoup(page, 'html.parser')
+            .find('div', attrs={'id': 'mw-content-text'}) for page in pages]
+
+
+def bench_dispatch(golden, trees):
+    records = OrderedDict()
+    for (champion, record), content_tags in zip(golden.items(), trees):
+        scrape = wiki.Scraper(None, champion, record['champ_id'],
+                              content_tags=content_tags)
+        scrape.populate_dictionary()
+        if scrape.found_classic:
+            scrape.populate_dictionary()
+        records.update(scrape.base_dict)
+    return records
+
+
+def bench_stream(golden, pages):
+    records = OrderedDict()
+    for (champion, record), page in zip(golden.items(), pages):
+        records.update(wiki.parse_page(champion, record['champ_id'], page,
+                                       'stream'))
+    return records
+
+
+def bench_export(records, directory):
+    with ExportWriter(os.path.join(directory, 'export.json')) as writer:
+        for champion, record in records.items():
+            writer.write({champion: record})
+
+
+def bench_main_all(url, directory, extra_args):
+    # Runs `wiki.py -a` against the stand-in wiki in a scratch directory.
+    # Returns the exported corpus and the child's peak RSS in MB.
+    shutil.copy(os.path.join(ROOT, 'name_id_dict.json'), directory)
+    shutil.copy(os.path.join(ROOT, 'riot_api_key.json'), directory)
+    command = [sys.executable, os.path.join(ROOT, 'wiki.py'), '-a',
+               '--wiki-url', url, '--rate', '0'] + extra_args
+    subprocess.run(command, cwd=directory, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    export = os.path.join(directory, 'quotes_list_export.json')
+    with open(export, 'r') as file:
+        return json.load(file, object_pairs_hook=OrderedDict), peak
+
+
+def bench_startup(directory):
+    # Wall time of `wiki.py query champion 157` over that of a bare
+    # interpreter, and the heavy modules it imported.
+    shutil.copy(os.path.join(ROOT, 'name_id_dict.json'), directory)
+    command = [sys.executable, os.path.join(ROOT, 'wiki.py'), 'query',
+               'champion', '157']
+
+    def wall(command):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=directory, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return time.perf_counter() - start
+    overhead = min(wall(command) for _ in range(5)) - \
+        min(wall([sys.executable, '-c', 'pass']) for _ in range(5))
+    imports = subprocess.run(command[:1] + ['-X', 'importtime'] + command[1:],
+                             cwd=directory, check=True, capture_output=True,
+                             text=True).stderr
+    imported = {line.rsplit('|', 1)[-1].strip()
+                for line in imports.splitlines()
+                if line.startswith('import time:')}
+    return overhead, sorted(heavy for heavy in HEAVY_MODULES
+                            if any(name == heavy or
+                                   name.startswith(heavy + '.')
+                                   for name in imported))
+
+
+def check_riot_sync(directory):
+    # RiotAPIData against a stand-in with a new patch, one added and one
+    # renamed champion. Returns a list of failures.
+    failures = []
+    riot_dir = os.path.join(directory, 'riot')
+    os.makedirs(riot_dir)
+    shutil.copy(os.path.join(ROOT, 'name_id_dict.json'), riot_dir)
+    with open(os.path.join(riot_dir, 'riot_api_key.json'), 'w') as file:
+        json.dump({'riot_api_key': 'stand-in'}, file)
+    with open(os.path.join(ROOT, 'name_id_dict.json'), 'r') as file:
+        local = json.load(file, object_pairs_hook=OrderedDict)
+    names = {record['id']: record['name']
+             for record in local['data'].values()}
+    names[1] = 'Annie Hastur'
+    names[999] = 'Stand-In'
+    with StandInRiot('8.10.1', names) as riot:
+        def sync():
+            del riot.requests[:]
+            subprocess.run([sys.executable,
+                            os.path.join(ROOT, 'RiotAPIData.py'),
+                            '--api-url', riot.url],
+                           cwd=riot_dir, check=True,
+                           stdout=subprocess.DEVNULL,
+                           stderr=subprocess.DEVNULL)
+            with open(os.path.join(riot_dir, 'name_id_dict.json')) as file:
+                return len(riot.requests), json.load(
+                    file, object_pairs_hook=OrderedDict)
+        requests, synced = sync()
+        if requests != 2:
+            failures.append("riot_sync: {} requests for a new patch, not 2"
+                            .format(requests))
+        expected = OrderedDict(local)
+        expected['version'] = '8.10.1'
+        expected['data'] = OrderedDict(
+            (str(champ_id), OrderedDict([('id', champ_id), ('name', name)]))
+            for champ_id, name in sorted(names.items()))
+        if synced != expected:
+            failures.append("riot_sync: name_id_dict.json doesn't match the"
+                            " live champion list")
+        requests, _ = sync()
+        if requests:
+            failures.append("riot_sync: {} requests within the TTL, not 0"
+                            .format(requests))
+    return failures
+
+
+def check_structures():
+    # Both parser backends on the hand-written pages of page structures
+    # the fixtures lack. Returns a list of failures.
+    failures = []
+    for champion, (page, expected) in fixtures.load_structures().items():
+        for parser in ('bs4', 'stream'):
+            record = wiki.parse_page(champion, expected['champ_id'], page,
+                                     parser)[champion]
+            if record != expected:
+                failures.append("structures: {} with {}"
+                                .format(champion, parser))
+    return failures
+
+
+def check_audio_download(directory):
+    # AudioDownloader against a stand-in: a dropped transfer resumes from
+    # where it stopped, two URLs of the same audio keep one file, a file
+    # over the budget is skipped, and a second run only fetches what is
+    # missing. Returns a list of failures.
+    failures = []
+    audio_dir = os.path.join(directory, 'audio')
+    size = 30000
+    files = {name: bytes([i]) * size
+             for i, name in enumerate(('a.ogg', 'b.ogg', 'c.ogg'))}
+    files['a_copy.ogg'] = files['a.ogg']
+    with StandInAudio(files, cut={'b.ogg'}) as audio:
+        urls = [audio.url + '/files/' + name
+                for name in ('a.ogg', 'a_copy.ogg', 'b.ogg', 'c.ogg')]
+        fetcher = Fetcher(rate=0, retries=2, backoff=0.01)
+        results = AudioDownloader(audio_dir, fetcher, workers=1,
+                                  budget=2 * size + size // 2) \
+            .download_all(urls)
+        if list(results.values()) != ['done', 'done', 'done', 'skipped']:
+            failures.append("audio: first run gave {}".format(
+                list(results.values())))
+        b_ranges = [header for name, header in audio.requests
+                    if name == 'b.ogg']
+        if b_ranges != [None, 'bytes={}-'.format(size // 3)]:
+            failures.append("audio: dropped transfer retried with {}"
+                            .format(b_ranges))
+        stored = sorted(os.listdir(os.path.join(audio_dir, 'files')))
+        if len(stored) != 2:
+            failures.append("audio: {} files for 2 distinct ones"
+                            .format(len(stored)))
+        for name in stored:
+            with open(os.path.join(audio_dir, 'files', name), 'rb') as file:
+                if file.read() not in (files['a.ogg'], files['b.ogg']):
+                    failures.append("audio: {} is corrupt".format(name))
+        del audio.requests[:]
+        results = AudioDownloader(audio_dir, fetcher, workers=1,
+                                  verify=True).download_all(urls)
+        fetcher.close()
+        if list(results.values()) != ['present'] * 3 + ['done'] or \
+                [name for name, _ in audio.requests] != ['c.ogg']:
+            failures.append("audio: second run fetched {}".format(
+                [name for name, _ in audio.requests]))
+    return failures
+
+
+def check_cache_eviction(directory):
+    # Threads storing pages into a small ResponseCache, so that one
+    # evicts while the others are still writing their temporary files.
+    # No store may fail, and the cache must stay within its limit.
+    # Returns a list of failures.
+    cache = ResponseCache(os.path.join(directory, 'eviction_cache'),
+                          max_size=20000)
+    errors = []
+
+    def store(thread):
+        for n in range(200):
+            try:
+                cache.store('{}/{}'.format(thread, n), {}, os.urandom(1000))
+            except OSError as error:
+                errors.append(error)
+    threads = [threading.Thread(target=store, args=(thread,))
+               for thread in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    failures = ["cache_eviction: store failed: {}".format(error)
+                for error in errors[:3]]
+    cache.evict()
+    if cache.size > 20000:
+        failures.append("cache_eviction: {} bytes kept".format(cache.size))
+    return failures
+
+
+def check_shard_queue(directory):
+    # Two workers on one ShardQueue: an expired lease is taken over and
+    # the late result dropped, a failing champion is retried after a
+    # backoff until it runs out of attempts, and only one worker merges,
+    # in roster order. Returns a list of failures.
+    failures = []
+    path = os.path.join(directory, 'shard_check.sqlite3')
+    champions = [('Annie', 1), ('Olaf', 2), ('Galio', 3)]
+
+    def record(champ_id):
+        return OrderedDict([('champ_id', champ_id),
+                            ('quotes', OrderedDict())])
+    a = ShardQueue(path, champions, {}, lease=0.2, attempts=2, backoff=0.2,
+                   worker='a')
+    b = ShardQueue(path, champions, {}, lease=0.2, attempts=2, backoff=0.2,
+                   worker='b')
+    if a.claim() != ('Annie', 1) or b.claim() != ('Olaf', 2):
+        failures.append("shard_queue: claims out of roster order")
+    time.sleep(0.3)
+    if b.claim() != ('Annie', 1):
+        failures.append("shard_queue: expired lease not reclaimed")
+    if a.complete('Annie', record(0)):
+        failures.append("shard_queue: result of a lost lease kept")
+    b.complete('Annie', record(1))
+    b.complete('Olaf', record(2), error='HTTP Error 503')
+    if a.claim() != ('Galio', 3):
+        failures.append("shard_queue: failed champion retried at once")
+    a.complete('Galio', record(3))
+    if a.finish():
+        failures.append("shard_queue: merged with a champion backing off")
+    time.sleep(0.3)
+    if a.claim() != ('Olaf', 2):
+        failures.append("shard_queue: failed champion not retried")
+    if a.finish():
+        failures.append("shard_queue: merged with a champion leased")
+    a.complete('Olaf', record(2), error='HTTP Error 503')
+    if a.claim() is not None or [a.finish(), b.finish()] != [True, False]:
+        failures.append("shard_queue: not merged by exactly one worker")
+    if list(a.failures()) != ['Olaf']:
+        failures.append("shard_queue: Olaf not failed after 2 attempts")
+    merged = os.path.join(directory, 'sharded.json')
+    with ExportWriter(merged) as writer:
+        a.merge(writer)
+    with open(merged, 'r') as file:
+        if json.load(file, object_pairs_hook=OrderedDict) != OrderedDict(
+                (name, record(champ_id)) for name, champ_id in champions):
+            failures.append("shard_queue: merged export out of order")
+    # Workers joining later only retry what failed, and once nothing
+    # has, leave the merged queue alone unless told to reset it.
+    late = ShardQueue(path, champions, {}, worker='c')
+    if late.merged or late.claim() != ('Olaf', 2) or late.claim():
+        failures.append("shard_queue: late worker didn't retry only Olaf")
+    late.complete('Olaf', record(2))
+    late.finish()
+    if not ShardQueue(path, champions, {}, worker='d').merged:
+        failures.append("shard_queue: merged queue started over")
+    if ShardQueue(path, champions, {}, worker='d', reset=True) \
+            .progress()['todo'] != len(champions):
+        failures.append("shard_queue: reset didn't start over")
+    return failures
+
+
+def check_shard_worker_command():
+    # The workers started by --shards get the fetch and parse options,
+    # but not this run's own, like --shard-reset, which would start over
+    # a queue that a late worker finds already merged. Returns a list of
+    # failures.
+    options = wiki.argument_parser().parse_args([
+        '-a', '-w', '3', '--rate', '0', '--cache', '--parser', 'stream',
+        '--shards', '3', '--shard-reset', '--profile', '-d', '--dedup',
+        '--journal'])
+    options.shard_queue = 'shard_queue.sqlite3'
+    command = wiki.shard_worker_command(options, 'metrics.1.json')[2:]
+    expected = ['-a', '-w', '3', '--rate', '0.0', '--cache', '.http_cache',
+                '--parser', 'stream', '--shard-queue', 'shard_queue.sqlite3',
+                '--shard-worker', '--metrics', 'metrics.1.json']
+    if [arg for arg in command if arg in expected] != expected:
+        return ["shard_worker_command: missing options: " +
+                " ".join(command)]
+    passed = {'--shards', '--shard-reset', '--profile', '-d', '--dedup',
+              '--journal'}.intersection(command)
+    if passed:
+        return ["shard_worker_command: passed on " + " ".join(sorted(passed))]
+    return []
+
+
+def mismatches(golden, records):
+    if list(golden) != list(records):
+        return ['(champion order)']
+    return [champion for champion in golden
+            if golden[champion] != records[champion]]
+
+
+def run(args):
+    golden = fixtures.load_golden()
+    if not os.path.isdir(fixtures.FIXTURES):
+        fixtures.record_fixtures(golden)
+    pages = {champion: fixtures.load_fixture(champion) for champion in golden}
+    champions = list(golden)
+    results = OrderedDict()
+    failures = []
+    with StandInWiki(pages) as stand_in, \
+            tempfile.TemporaryDirectory() as scratch:
+        results['fetch'], fetched = timed(
+            lambda: bench_fetch(stand_in.url, champions, args.workers),
+            args.repeat)
+        results['parse'], trees = timed(lambda: bench_parse(fetched),
+                                        args.repeat)
+        results['dispatch'], records = timed(
+            lambda: bench_dispatch(golden, trees), args.repeat)
+        failures += ['dispatch: ' + c for c in mismatches(golden, records)]
+        results['stream'], streamed = timed(
+            lambda: bench_stream(golden, fetched), args.repeat)
+        failures += ['stream: ' + c for c in mismatches(golden, streamed)]
+        failures += check_structures()
+        results['export'], _ = timed(lambda: bench_export(records, scratch),
+                                     args.repeat)
+        results['main_all'], (exported, peak) = timed(
+            lambda: bench_main_all(stand_in.url, scratch,
+                                   ['-w', str(args.workers)]),
+            args.repeat)
+        failures += ['main_all: ' + c for c in mismatches(golden, exported)]
+        results['main_all_sharded'], (exported, _) = timed(
+            lambda: bench_main_all(stand_in.url, scratch, [
+                '--shards', str(args.shards), '--shard-reset',
+                '-w', str(max(args.workers // args.shards, 1))]),
+            args.repeat)
+        failures += ['main_all_sharded: ' + c
+                     for c in mismatches(golden, exported)]
+        failures += check_cache_eviction(scratch)
+        failures += check_shard_queue(scratch)
+        failures += check_shard_worker_command()
+        failures += check_audio_download(scratch)
+        failures += check_riot_sync(scratch)
+        results['startup_query'], heavy = bench_startup(scratch)
+        failures += ['startup_query imported ' + name for name in heavy]
+        if results['startup_query'] > args.max_startup:
+            failures.append("startup_query: {:.4f}s over the {}s target"
+                            .format(results['startup_query'],
+                                    args.max_startup))
+    results['main_all_champions_per_s'] = \
+        len(champions) / results['main_all']
+    results['main_all_peak_rss_mb'] = peak
+    return results, failures
+
+
+def compare(results, baseline, threshold):
+    # Stage times and peak memory must not grow by more than `threshold`
+    # (a fraction). Throughput must not drop by more than it.
+    regressions = []
+    for stage, value in results.items():
+        if stage not in baseline:
+            continue
+        if stage.endswith('_per_s'):
+            worse = value < baseline[stage] / (1 + threshold)
+        else:
+            worse = value > baseline[stage] * (1 + threshold)
+        if worse:
+            regressions.append("{}: {:.4g} vs baseline {:.4g}"
+                               .format(stage, value, baseline[stage]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark each scraper stage against recorded"
+        " fixtures of the 8.9.1 corpus.")
+    parser.add_argument("--repeat", help="Runs per stage; the best is kept."
+                        " Defaults to 3.", type=int, default=3)
+    parser.add_argument("--workers", help="Fetch workers. Defaults to 8.",
+                        type=int, default=8)
+    parser.add_argument("--shards", help="Worker processes for the"
+                        " main_all_sharded stage, which split --workers"
+                        " between them. Defaults to 4.", type=int, default=4)
+    parser.add_argument("--threshold", help="Allowed slowdown against the"
+                        " baseline, as a fraction. Defaults to 0.5.",
+                        type=float, default=0.5)
+    parser.add_argument("--max-startup", help="Target for the startup_query"
+                        " stage: seconds a `wiki.py query` may take over a"
+                        " bare interpreter. Defaults to 0.15.", type=float,
+                        default=0.15)
+    parser.add_argument("--baseline", help="Baseline file. Defaults to"
+                        " benchmarks/baseline.json.", default=BASELINE)
+    parser.add_argument("--update-baseline", help="Store these results as"
+                        " the new baseline.", action='store_true')
+    args = parser.parse_args()
+
+    results, failures = run(args)
+    for stage, value in results.items():
+        print("{:<28}{:>12.4f}".format(stage, value))
+    if args.update_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump(results, file, indent=4)
+        print("Baseline written to", args.baseline)
+    else:
+        try:
+            with open(args.baseline, 'r') as file:
+                failures += compare(results, json.load(file),
+                                    args.threshold)
+        except FileNotFoundError:
+            print("No baseline at", args.baseline,
+                  "- run with --update-baseline to create one.")
+    for failure in failures:
+        print("FAIL", failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+import gzip
+import json
+import os
+import re
+from collections import OrderedDict
+from html import escape
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+GOLDEN = os.path.join(ROOT, '8.9.1_all_quotes.json')
+FIXTURES = os.path.join(HERE, 'fixtures')
+# Hand-written pages with what render_page() never produces: data-skin
+# spans and skin quotes, a Classic / Live tab, a conversation with
+# another champion, and a blacklisted h2. expected.json holds the records
+# the Scraper must make of them.
+STRUCTURES = os.path.join(HERE, 'structures')
+RENAMED_RE = re.compile(r'^(.*)\.(\d+)$')
+
+
+def load_golden(path=GOLDEN):
+    with open(path, 'r') as file:
+        return json.load(file, object_pairs_hook=OrderedDict)
+
+
+def render_page(champion, record):
+    # Renders a Quotes page in the wiki's markup that the Scraper turns
+    # back into `record`: one h2 per category, one list item per quote,
+    # each with its audio file link.
+    parts = [
+        '<!DOCTYPE html><html><head><meta charset="utf-8">',
+        '<title>{}/Quotes | League of Legends Wiki</title></head><body>'
+        .format(escape(champion)),
+        '<div id="WikiaPage"><nav>Navigation</nav>',
+        '<div id="mw-content-text" class="mw-content-ltr">',
+        '<p><b>{}</b> quotes.</p>'.format(escape(champion)),
+    ]
+    previous = ''
+    for h2, quotes in record['quotes'].items():
+        if not h2.startswith('(missing_h2.'):
+            parts.append('<h2><span class="mw-headline" id="{0}">{0}</span>'
+                         '</h2>'.format(escape(h2)))
+        parts.append('<ul>')
+        for quote_id, quote in quotes.items():
+            # "Annie.attack5.1" is the Scraper's name for a second quote
+            # whose audio file is Annie.attack5.
+            renamed = RENAMED_RE.match(quote_id)
+            if renamed and renamed.group(1) == previous:
+                audio_id = previous
+            else:
+                audio_id = previous = quote_id
+            parts.append(
+                '<li><a href="/wiki/File:{0}.ogg" title="File:{0}.ogg">'
+                '<img alt="Play" src="/play.png" width="16"></a> '
+                '<i>{1}</i></li>'.format(escape(audio_id), escape(quote)))
+        parts.append('</ul>')
+    parts.append('<h2><span class="mw-headline">References</span></h2>'
+                 '<ol class="references"><li>Patch notes</li></ol>')
+    parts.append('</div><footer>CC-BY-SA</footer></div></body></html>')
+    return '\n'.join(parts).encode('utf-8')
+
+
+def fixture_path(champion, directory=FIXTURES):
+    return os.path.join(directory, champion.replace(' ', '_') + '.html.gz')
+
+
+def record_fixtures(golden=None, directory=FIXTURES):
+    # Writes one gzipped page per champion of the golden corpus.
+    golden = golden if golden is not None else load_golden()
+    os.makedirs(directory, exist_ok=True)
+    for champion, record in golden.items():
+        # mtime=0 keeps re-recorded fixtures byte-identical.
+        with open(fixture_path(champion, directory), 'wb') as raw, \
+                gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as file:
+            file.write(render_page(champion, record))
+    return len(golden)
+
+
+def load_fixture(champion):
+    with gzip.open(fixture_path(champion), 'rb') as file:
+        return file.read()
+
+
+def load_structures(directory=STRUCTURES):
+    # champion -> (page, expected record)
+    expected = load_golden(os.path.join(directory, 'expected.json'))
+    pages = OrderedDict()
+    for champion, record in expected.items():
+        with open(os.path.join(directory, champion + '.html'), 'rb') as file:
+            pages[champion] = (file.read(), record)
+    return pages
+
+
+if __name__ == '__main__':
+    print("Recorded", record_fixtures(), "fixtures to", FIXTURES)
@@ -0,0 +1,143 @@
+import argparse
+import http.client
+import json
+import os
+import random
+import sys
+import threading
+import time
+from urllib.parse import quote, urlsplit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+
+import QuoteSearch  # noqa: E402
+import QuoteServer  # noqa: E402
+
+GOLDEN = os.path.join(ROOT, '8.9.1_all_quotes.json')
+
+
+def request_mix(corpus, count, seed=0):
+    # Paths like the bots send: mostly random picks and lookups of a
+    # champion or one of its categories, with some searches.
+    rng = random.Random(seed)
+    champions = list(corpus)
+    words = sorted({word for record in corpus.values()
+                    for quotes in record['quotes'].values()
+                    for line in quotes.values()
+                    for word in QuoteSearch.tokenize(line)}) or ['fire']
+    paths = []
+    for _ in range(count):
+        champion = rng.choice(champions)
+        categories = list(corpus[champion]['quotes']) or ['Taunt']
+        category = quote(rng.choice(categories))
+        kind = rng.random()
+        if kind < 0.4:
+            paths.append('/random?champion={}&category={}'
+                         .format(quote(champion), category))
+        elif kind < 0.6:
+            paths.append('/quotes/' + quote(champion))
+        elif kind < 0.8:
+            paths.append('/quotes/{}?category={}'
+                         .format(corpus[champion]['champ_id'] or
+                                 quote(champion), category))
+        elif kind < 0.9:
+            paths.append('/categories/' + category)
+        else:
+            paths.append('/search?k=5&q=' + quote(rng.choice(words)))
+    return paths
+
+
+def client(host, port, paths, latencies, errors):
+    # One keep-alive connection, like a bot holding a session.
+    connection = http.client.HTTPConnection(host, port)
+    for path in paths:
+        start = time.perf_counter()
+        try:
+            connection.request('GET', path)
+            response = connection.getresponse()
+            response.read()
+            if response.status >= 500:
+                errors.append(path)
+        except (OSError, http.client.HTTPException):
+            errors.append(path)
+            connection.close()
+            connection = http.client.HTTPConnection(host, port)
+            continue
+        latencies.append(time.perf_counter() - start)
+    connection.close()
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    i = min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values))))
+    return sorted_values[i]
+
+
+def run(url, corpus, clients, requests):
+    host, port = urlsplit(url).hostname, urlsplit(url).port or 80
+    latencies, errors = [], []
+    mixes = [request_mix(corpus, requests, seed) for seed in range(clients)]
+    threads = [threading.Thread(target=client, args=(host, port, paths,
+                                                     latencies, errors))
+               for paths in mixes]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'requests_per_s': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'max_ms': (latencies[-1] if latencies else 0) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Load test QuoteServer.py with a mix of random picks,"
+        " lookups and searches, and report latency percentiles. Starts a"
+        " server on the export unless --url is given.")
+    parser.add_argument('export', nargs='?', help="Export to serve, and to"
+                        " draw request paths from. Defaults to the 8.9.1"
+                        " corpus.", default=GOLDEN)
+    parser.add_argument("--url", help="Test a running server instead.")
+    parser.add_argument("--clients", help="Concurrent keep-alive clients."
+                        " Defaults to 16.", type=int, default=16)
+    parser.add_argument("--requests", help="Requests per client. Defaults"
+                        " to 500.", type=int, default=500)
+    parser.add_argument("--max-p99", help="Fail if p99 latency exceeds"
+                        " this many milliseconds.", type=float)
+    args = parser.parse_args()
+
+    corpus = QuoteServer.load_export(args.export)
+    server = None
+    url = args.url
+    if url is None:
+        service = QuoteServer.QuoteService(args.export)
+        server = QuoteServer.make_server(service, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = 'http://127.0.0.1:{}'.format(server.server_port)
+    try:
+        results = run(url, corpus, args.clients, args.requests)
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+            service.stop()
+    print(json.dumps(results, indent=4))
+    failed = results['errors'] or (args.max_p99 is not None and
+                                   results['p99_ms'] > args.max_p99)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
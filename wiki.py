@@ -1,24 +1,70 @@
 import sys
+if __name__ == '__main__' and sys.argv[1:2] == ['query']:
+    # Read-only lookups; see QuoteQuery.py. Dispatched before the
+    # scraping stack below is imported, so that queries start quickly.
+    import QuoteQuery
+    sys.exit(QuoteQuery.main(sys.argv[2:]))
 import re
 import argparse
+import functools
+import importlib.util
 import json
-import urllib.request
+import os
+import http.client
+import subprocess
+import threading
+import time
 import urllib.error
-from difflib import SequenceMatcher
-from contextlib import suppress
-from collections import OrderedDict
-from bs4 import BeautifulSoup
-with suppress(ImportError):
-    from RiotAPIData import RiotAPIData
+from contextlib import nullcontext, suppress
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from Fetcher import Fetcher
+from ResponseCache import ResponseCache
+from ExportWriter import ExportWriter, load_export
+from AudioDownload import AudioDownloader, summarize
+from StreamParser import StreamParser
+from QuoteSearch import QuoteIndex
+from ChampionIndex import get_champion_index, get_champion_table
+from Metrics import METRICS, Metrics
+from ScrapeJournal import ScrapeJournal
+from ShardQueue import ShardQueue
+import DeltaScrape
+# bs4, RiotAPIData (riotwatcher) and the other heavy imports are made
+# where they are first needed, so that `wiki.py query` and library users
+# that don't scrape start quickly.
+
+WIKI_URL = 'http://leagueoflegends.wikia.com'
+
+# Patterns used by the tag handlers, compiled once per process.
+OGG_FILE_RE = re.compile(r'(?<=:).*(?=\.ogg)')
+PRE_QUOTE_RE = re.compile(r'.*?(?=")')
+QUOTE_RE = re.compile(r'(?=\").*(?<=\")')
+NOISE_RE = re.compile(r'.*')
+SELECT_RE = re.compile(r'select', re.IGNORECASE)
+
+
+def quotes_url(champion, wiki_url=WIKI_URL):
+    return (wiki_url.rstrip('/') + '/wiki/' + champion.replace(' ', '_') +
+            '/Quotes')
+
+
+def audio_url(ogg_file_name, wiki_url=WIKI_URL):
+    # The wiki redirects Special:FilePath to the file itself.
+    return (wiki_url.rstrip('/') + '/wiki/Special:FilePath/' +
+            ogg_file_name + '.ogg')
 
 
 class Scraper:
-    def __init__(self, args, champion, champ_id=0, content_tags=None):
+    def __init__(self, args, champion, champ_id=0, content_tags=None,
+                 fetcher=None, page=None, metrics=None):
         self.args = args
+        self.metrics = metrics if metrics is not None else METRICS
+        self.fetcher = fetcher if fetcher is not None else Fetcher(args)
+        self.page = page  # Page body, if it was already fetched.
         self.champion = champion
         self.champ_id = champ_id
-        self.site = 'http://leagueoflegends.wikia.com/wiki/' + \
-            self.champion.replace(' ', '_') + '/Quotes'
+        self.wiki_url = getattr(args, 'wiki_url', WIKI_URL)
+        self.site = quotes_url(self.champion, self.wiki_url)
         self.content_tags = content_tags
         self.base_dict = OrderedDict([
             (self.champion, OrderedDict([
@@ -26,8 +72,16 @@ class Scraper:
                 ('quotes', OrderedDict()),
             ]))
         ])
+        # With --audio, quote_id -> URL of the quote's audio file.
+        self.audio = None
+        if getattr(args, 'audio', False):
+            self.audio = self.base_dict[self.champion]['audio'] = \
+                OrderedDict()
         self.blacklist = {"", "References", "Co-op vs. AI Responses", }
         self.data_skin_blacklist = []
+        # One alternation of every blacklisted skin, rebuilt only when
+        # handle_span adds a skin. See skin_matcher().
+        self.skin_re = None
         self.found_classic = self.blacklisted_h2 = \
             self.quote_by_correct_champ = self.quote_id_modified = \
             self.found_classic_skin_quote = False
@@ -44,24 +98,44 @@ class Scraper:
             'i': self.handle_i,
         }
 
-    def get_content_tags(self):
+    def get_page(self):
         try:
-            page = urllib.request.urlopen(self.site)
+            if self.page is None:
+                with self.metrics.timer('fetch', self.champion):
+                    self.page = self.fetcher.fetch(self.site)
+                self.metrics.count('bytes_fetched', len(self.page),
+                                   self.champion)
         except urllib.error.HTTPError as e:
             print(e)
             print(e.code)
             if e.code == 404:
-                if self.args.e:
+                if getattr(self.args, 'e', False):
                     print(e)
                 return None
-        soup = BeautifulSoup(page, 'html.parser')
-        self.content_tags = soup.find('div', attrs={'id': 'mw-content-text'})
+            self.metrics.fail(self.champion, e)
+        except (OSError, http.client.HTTPException) as e:
+            # Retries are exhausted. Record the champion for a follow-up
+            # pass instead of aborting the whole run.
+            print(self.champion + ':', e)
+            self.metrics.fail(self.champion, e)
+        return self.page
+
+    def get_content_tags(self):
+        page = self.get_page()
+        if page is None:
+            return None
+        with self.metrics.timer('parse', self.champion):
+            from bs4 import BeautifulSoup
+            soup = BeautifulSoup(page, 'html.parser')
+            self.content_tags = soup.find('div',
+                                          attrs={'id': 'mw-content-text'})
         return self.content_tags
 
     def handle_span(self, tag):
         data_skin = tag.get('data-skin')
         if data_skin not in {'Original', None}:
             self.data_skin_blacklist.append(data_skin)
+            self.skin_re = None
 
     def handle_div(self, tag):
         if (not self.found_classic and
@@ -91,48 +165,49 @@ class Scraper:
         if not self.blacklisted_h2:
             a_href = tag.get("href")
             # ogg_file_name is the name of the audio file for quotes.
-            ogg_file_name = re.search(r'(?<=:).*(?=\.ogg)', a_href)
+            ogg_file_name = OGG_FILE_RE.search(a_href)
             if self.possible_champ_converse and ogg_file_name:
                 # Search for name of possible conversing champ at
                 # beginning of string. Ex.: Karthus.tauntUrgot01
-                regex = r'^' + self.possible_champ_converse
-                if re.search(regex, ogg_file_name.group()):
+                if ogg_file_name.group().startswith(
+                        self.possible_champ_converse):
                     self.quote_by_correct_champ = False
             # If the classic skin quote has not already been found,
             # if the audio file pertaining to the quote exists,
             # and if the quote is spoken by the page's respective champion.
             if (not self.found_classic_skin_quote and ogg_file_name and
                     self.quote_by_correct_champ):
-                for skin in self.data_skin_blacklist:
-                    # Check if blacklisted skin matches the audio file name.
-                    if (re.search(skin.replace(' ', ''),
-                                  ogg_file_name.group(0),
-                                  re.IGNORECASE)):
-                        self.quote_id = ogg_file_name.group(0)
-                        self.found_classic_skin_quote = False
-                        break
-                else:
-                    self.quote_id = ogg_file_name.group(0)
-                    self.found_classic_skin_quote = True
+                self.quote_id = ogg_file_name.group(0)
+                # Check if any blacklisted skin matches the audio file name.
+                skin_re = self.skin_matcher()
+                self.found_classic_skin_quote = not (
+                    skin_re and skin_re.search(self.quote_id))
             elif not ogg_file_name:
                 self.possible_champ_converse = tag.text
 
+    def skin_matcher(self):
+        if self.skin_re is None and self.data_skin_blacklist:
+            self.skin_re = re.compile(
+                '|'.join(re.escape(skin.replace(' ', ''))
+                         for skin in self.data_skin_blacklist),
+                re.IGNORECASE)
+        return self.skin_re
+
     def handle_li(self, tag):
         if not self.possible_champ_converse:
             self.quote_by_correct_champ = True
         if self.possible_champ_converse and not self.blacklisted_h2:
-            pre_quote_regex = r'.*?(?=")'
             # Searches text for an explicitly stated speaker by
             # viewing text preceeding a quotation mark.
             # Ex. Xayah: "You're cute today!"
-            pre_quote = re.search(pre_quote_regex, tag.text)
+            pre_quote = PRE_QUOTE_RE.search(tag.text)
             if pre_quote:
                 pre_quote = pre_quote.group(0)
                 # If other champion is speaking the quote,
                 # and not the champion of the page.
                 if (
-                    re.search(self.possible_champ_converse, pre_quote) and
-                    not re.search(self.champion, pre_quote)
+                    self.possible_champ_converse in pre_quote and
+                    self.champion not in pre_quote
                 ):
                     self.quote_by_correct_champ = False
                 else:
@@ -156,15 +231,15 @@ class Scraper:
                 self.quote_id_modified = False
             self.prev_valid_quote_id = self.quote_id
 
-            quote = re.search(r'(?=\").*(?<=\")', tag.text)
+            quote = QUOTE_RE.search(tag.text)
             if self.champion in {'Bard', 'Rek\'Sai'}:  # Champions who only make noises
-                quote = re.search(r'.*', tag.text)
+                quote = NOISE_RE.search(tag.text)
             if quote:
                 quote = quote.group(0)
                 quote = quote.replace('\u200b', '')  # Zero Width Space
                 quote = quote.replace('\u00a0', '')  # No-Break Space
                 if not self.h2:
-                    if re.search(r'select', self.quote_id, re.IGNORECASE):
+                    if SELECT_RE.search(self.quote_id):
                         self.h2 = "Champion Select"
                     else:
                         self.h2 = ("(missing_h2." +
@@ -178,6 +253,12 @@ class Scraper:
                 else:
                     (self.base_dict[self.champion]['quotes'][self.h2]
                         [self.quote_id]) = quote
+                if self.audio is not None:
+                    # A renamed quote_id reuses the file it was named after.
+                    self.audio[self.renamed_quote_id
+                               if self.quote_id_modified
+                               else self.quote_id] = \
+                        audio_url(self.quote_id, self.wiki_url)
             else:
                 # print("Invalid quote. Skipping...")
                 pass
@@ -199,24 +280,52 @@ class Scraper:
 
     def populate_dictionary(self):
         self.found_classic = False
-        for tag in self.content_tags.findAll():
-            # handle_defualt() is the fall back case if the function with
-            # the same name as tag.name is not found in the func_dict.
-            self.func_dict.get(tag.name, self.handle_default)(tag)
-            if self.found_classic:
-                return
+        handler_calls = Counter()
+        with self.metrics.timer('dispatch', self.champion):
+            for tag in self.content_tags.findAll():
+                # handle_defualt() is the fall back case if the function with
+                # the same name as tag.name is not found in the func_dict.
+                handler = self.func_dict.get(tag.name)
+                if handler is None:
+                    handler_calls['default'] += 1
+                    handler = self.handle_default
+                else:
+                    handler_calls[tag.name] += 1
+                handler(tag)
+                if self.found_classic:
+                    break
+        self.metrics.count_handlers(handler_calls, self.champion)
+
+    def populate(self, parser='bs4'):
+        if parser == 'stream':
+            self.stream_populate_dictionary()
+            return self.base_dict
+        if self.get_content_tags() is None:
+            return self.base_dict
+        self.populate_dictionary()
+        # If a skin selector tab is found, content_tags is switched to the
+        # Classic / Live / (Champion Name) tag, found_classic is set to True,
+        # and populate_dictionary() is called again to scrape within that tag.
+        if self.found_classic:
+            self.populate_dictionary()
+        return self.base_dict
 
-    def write_dict_to_file(self, json_file):
-        with open(json_file, 'r') as file:
-            dic = json.load(file)
-        dic.update(self.base_dict)
-        with open(json_file, 'w') as file:
-            json.dump(dic, file, indent=4)
+    def stream_populate_dictionary(self):
+        # Single pass alternative to get_content_tags() followed by
+        # populate_dictionary(), which also covers the Classic / Live tab.
+        page = self.get_page()
+        if page is not None:
+            parser = StreamParser(self)
+            with self.metrics.timer('stream', self.champion):
+                parser.parse(page)
+            self.metrics.count_handlers(parser.handler_calls, self.champion)
 
 
 class InputParser:
-    def __init__(self, args):
+    def __init__(self, args, fetcher=None):
         self.args = args  # Command line arguments
+        self.fetcher = fetcher if fetcher is not None else Fetcher(args)
+        self.pages = {}  # Verified champion -> page body, for the Scraper.
         self.input_ = ''  # Unmodified input
         self.f_input = ''  # Formatted Input
         self.champion = ''  # Verified champion, otherwise None.
@@ -225,10 +334,10 @@ class InputParser:
         self.champion_list = []  # Verified champion list
 
     def page_exists(self, f_input):
-        site = ('http://leagueoflegends.wikia.com/wiki/' +
-                f_input.replace(' ', '_') + '/Quotes')
+        site = quotes_url(f_input, getattr(self.args, 'wiki_url', WIKI_URL))
         try:
-            urllib.request.urlopen(site)
+            # Keep the body so the Scraper doesn't download it again.
+            self.pages[f_input] = self.fetcher.fetch(site)
             return True
         except urllib.error.HTTPError as e:
             if e.code == 404:
@@ -247,33 +356,17 @@ class InputParser:
                                   self.f_input)
         return self.f_input
 
-    # Create a list of champions whose first letter matches
-    # the first letter of the input.
-    def search_for_champ(self, find_me, name_id_dict):
-        champions_matching_1st_letter = \
-            [name_id_dict['data'][champ]['name']
-             for champ in name_id_dict['data']
-             if find_me[0] == name_id_dict['data'][champ]['name'][0]]
-        seq_list = []
-        for champ in champions_matching_1st_letter:
-            m = SequenceMatcher(None, find_me, champ)
-            # print(champ, m.ratio())
-            seq_list.append((champ, m.ratio()))
-        # Sort sequence list by highest match ratio.
-        seq_list = sorted(seq_list, key=lambda x: x[1], reverse=True)
-        if not seq_list:
-            return None
-        # Return the matched self.champion if the match ratio is >= 0.7.
-        # seq_list[0][0] is the champion name, seq_list[0][1] is the ratio.
-        return seq_list[0][0] if seq_list[0][1] >= 0.7 else None
+    # Find the closest champion name in name_id_dict.json, using an
+    # n-gram index that is loaded once per process.
+    def search_for_champ(self, find_me):
+        # Return the matched champion if the match ratio is >= 0.7.
+        return get_champion_index().best_match(find_me, cutoff=0.7)
 
     def verify_champion(self, f_input):
         if self.page_exists(f_input):
             self.champion = f_input
         elif hasFile['name_id_dict.json']:
-            with open('name_id_dict.json', 'r') as file:
-                name_id_dict = json.load(file)
-            self.champion = self.search_for_champ(f_input, name_id_dict)
+            self.champion = self.search_for_champ(f_input)
         else:
             self.champion = None
         return self.champion
@@ -298,21 +391,18 @@ class InputParser:
 
 def id_lookup(champion):
     try:
-        with open('name_id_dict.json', 'r') as file:
-            name_id_dict = json.load(file)
+        table = get_champion_table()
     except FileNotFoundError:
         print("Lookup file 'name_id_dict.json' not found,",
               "setting champion ID to 0.")
         return 0
-    champ_id = \
-        next((name_id_dict['data'][champ]['id']
-              for champ in name_id_dict['data']
-              if champion == name_id_dict['data'][champ]['name']), 0)
-    return champ_id
+    return table.id_of(champion, 0)
 
 
 def update_name_id_dict(prompted=False):
-    riot_api_data = RiotAPIData(args)
+    from RiotAPIData import RiotAPIData
+    # The live version is asked for at most once per --riot-ttl.
+    riot_api_data = RiotAPIData(args, ttl=args.riot_ttl * 3600)
     versions = riot_api_data.check_versions()
     print("Local version:\t{}".format(versions['local']
                                       if versions['local'] is not None
@@ -326,16 +416,43 @@ def update_name_id_dict(prompted=False):
         if not prompted:
             input_ = input("New patch available. Download new champion list?"
                            " | 'y' for yes\nPress Enter to continue.\n")
-        if input_.lower() == 'y' or prompted:
-            riot_api_data.download_champ_data()
+        if prompted or input_.lower() == 'y':
+            changes = riot_api_data.download_champ_data()
+            for kind, names in changes.items():
+                print(kind.capitalize() + ":", ", ".join(names) or "-")
             with suppress(FileNotFoundError):
                 with open('name_id_dict.json'):
                     hasFile['name_id_dict.json'] = True
 
 
-def empty_dict(json_file):
-    with open(json_file, 'w') as file:
-        json.dump(OrderedDict(), file, indent=4)
+def export_file():
+    if args.ndjson:
+        return 'quotes_list_export.ndjson'
+    return 'quotes_list_export.json'
+
+
+def export_writer():
+    # Each champion is appended as it finishes, and the export
+    # (replacing any previous one) is completed when the writer closes.
+    # With --index, scraped champions also replace their entries in the
+    # search index.
+    index = QuoteIndex.open(args.index) if args.index else None
+    binary_file = 'quotes_list_export.lwqc' if args.binary else None
+    dedup_file = 'quotes_list_export.dedup.json' if args.dedup else None
+    return ExportWriter(export_file(), ndjson=args.ndjson, index=index,
+                        index_file=args.index, binary_file=binary_file,
+                        dedup_file=dedup_file, metrics=METRICS)
+
+
+def download_audio(fetcher):
+    # With --audio-dir, download the audio of every quote in the export.
+    budget = args.audio_budget * 1024 * 1024 if args.audio_budget else None
+    downloader = AudioDownloader(args.audio_dir, fetcher, args.audio_workers,
+                                 budget=budget, metrics=METRICS)
+    with METRICS.timer('audio'):
+        results = downloader.download_corpus(load_export(export_file()))
+    print("Audio files:", ", ".join("{} {}".format(n, kind) for kind, n
+                                    in summarize(results).items()))
 
 
 def main_one(ip):
@@ -352,18 +469,10 @@ def main_one(ip):
         champ_id = 0
         if args.i and hasFile['name_id_dict.json']:
             champ_id = id_lookup(ip.champion)
-        scrape = Scraper(args, ip.champion, champ_id)
-        scrape.get_content_tags()
-        scrape.populate_dictionary()
-        # If a skin selector tab is found, content_tags is switched to the
-        # Classic / Live / (Champion Name) tag, found_classic is set to True,
-        # and populate_dictionary() is called again to scrape within that tag.
-        if scrape.found_classic:
-            scrape.populate_dictionary()
-        # Empty out quotes_list_export.json, replace with an empty
-        # dictionary. Do this before looping over multiple champions.
-        empty_dict('quotes_list_export.json')
-        scrape.write_dict_to_file('quotes_list_export.json')
+        with export_writer() as writer:
+            for base_dict in scrape_many([(ip.champion, champ_id)],
+                                         ip.fetcher, ip.pages):
+                writer.write(base_dict)
         ip.champion_list.append(ip.champion)
 
 
@@ -396,39 +505,431 @@ def main_multi(ip):
         print("No champions found for the inputs:", ip.input_list)
         sys.exit()
     else:
-        empty_dict('quotes_list_export.json')
-        for champ in ip.champion_list:
-            champ_id = 0
-            if args.i and hasFile['name_id_dict.json']:
-                champ_id = id_lookup(champ)
-            scrape = Scraper(args, champ, champ_id)
-            scrape.get_content_tags()
-            scrape.populate_dictionary()
-            # If a skin selector tab is found, content_tags is switched to the
-            # Classic / Live / (Champion Name) tag, found_classic is set to True,
-            # and populate_dictionary() is called again to scrape within that tag.
-            if scrape.found_classic:
-                scrape.populate_dictionary()
-            scrape.write_dict_to_file('quotes_list_export.json')
-
-
-def main_all():
-    with open('name_id_dict.json', 'r') as file:
-        name_id_dict = json.load(file, object_pairs_hook=OrderedDict)
-    empty_dict('quotes_list_export.json')
-    for champ in name_id_dict['data']:
-        champion = name_id_dict['data'][champ]['name']
-        champ_id = name_id_dict['data'][champ]['id']
-        print(champion, "\n")
-        scrape = Scraper(args, champion, champ_id)
-        scrape.get_content_tags()
-        scrape.populate_dictionary()
-        # If a skin selector tab is found, content_tags is switched to the
-        # Classic / Live / (Champion Name) tag, found_classic is set to True,
-        # and populate_dictionary() is called again to scrape within that tag.
-        if scrape.found_classic:
-            scrape.populate_dictionary()
-        scrape.write_dict_to_file('quotes_list_export.json')
+        lookup = args.i and hasFile['name_id_dict.json']
+        champions = [(champ, id_lookup(champ) if lookup else 0)
+                     for champ in ip.champion_list]
+        with export_writer() as writer:
+            for base_dict in scrape_many(champions, ip.fetcher, ip.pages):
+                writer.write(base_dict)
+
+
+def scrape_champion(champion, champ_id=0, fetcher=None, page=None,
+                    parser='bs4', options=None):
+    # `options` is read like the command line arguments by the Scraper
+    # (-e, --wiki-url, --audio). None uses the defaults.
+    scrape = Scraper(options, champion, champ_id, fetcher=fetcher, page=page)
+    scrape.populate(parser)
+    return scrape
+
+
+def parse_page(champion, champ_id, page, parser='bs4', metrics=None,
+               options=None):
+    # Runs the Scraper handlers over an already fetched page. Takes and
+    # returns plain data, so it can run in a worker process. A worker
+    # has no share of the parent's per-host limits, so it never fetches.
+    if page is None:
+        raise ValueError("No page to parse for " + champion)
+    return Scraper(options, champion, champ_id, page=page,
+                   metrics=metrics).populate(parser)
+
+
+def parse_page_job(champion, champ_id, page, parser, options=None):
+    # parse_page() for a worker process, which also returns the metrics
+    # it recorded so that the parent can merge them.
+    metrics = Metrics()
+    return (parse_page(champion, champ_id, page, parser, metrics, options),
+            metrics.to_dict())
+
+
+def fetch_page(champion, fetcher, options=None):
+    return Scraper(options, champion, fetcher=fetcher).get_page()
+
+
+def champion_pairs(champions, resolve=False):
+    # (champion, champ_id) for every name or (name, champ_id) pair.
+    # With resolve, names are matched to name_id_dict.json like the
+    # interactive prompts do, and given their ID. Names that match no
+    # champion are skipped.
+    for champion in champions:
+        champ_id = 0
+        if not isinstance(champion, str):
+            champion, champ_id = champion
+        if resolve:
+            table = get_champion_table()
+            name = table.resolve(champion) or \
+                table.index.best_match(champion, cutoff=0.7)
+            if name is None:
+                print("No champions found for input:", champion)
+                continue
+            champion, champ_id = name, champ_id or table.id_of(name)
+        yield champion, champ_id
+
+
+def scrape_window(champions, submit, queue, ordered):
+    # Keeps at most `queue` futures from submit(champion, champ_id) in
+    # flight and yields their results, in roster order or as they
+    # finish. `champions` is only read as the window has room.
+    window = deque()
+    champions = iter(champions)
+    while True:
+        for champion, champ_id in champions:
+            window.append(submit(champion, champ_id))
+            if len(window) >= queue:
+                break
+        if not window:
+            return
+        if ordered:
+            yield window.popleft().result()
+        else:
+            done, _ = wait(window, return_when=FIRST_COMPLETED)
+            for future in done:
+                window.remove(future)
+                yield future.result()
+
+
+def scrape_champions(champions, fetcher=None, parser='bs4', workers=1,
+                     parse_workers=0, queue=16, ordered=True, resolve=False,
+                     pages=None, export=None, options=None):
+    # Library entry point. Scrapes each champion in `champions`, an
+    # iterable of names or (name, champ_id) pairs that is read lazily,
+    # and yields its base_dict, {champion: {'champ_id', 'quotes'}}, as
+    # soon as it is done: in roster order, or as pages finish with
+    # ordered=False.
+    # Pages are scraped by `workers` threads, and with parse_workers,
+    # parsed in that many processes, with at most `queue` champions in
+    # flight. The Fetcher is shared by every worker so that the per-host
+    # limits apply to the whole run; one with the defaults is made (and
+    # closed) if none is given. `pages` maps champions to page bodies
+    # that were already fetched.
+    # Nothing is written unless `export` names a file, which is written
+    # like the CLI export ('.ndjson' for one champion per line).
+    # Champions whose page couldn't be fetched get an empty record and
+    # are listed in METRICS.failures.
+    own_fetcher = fetcher is None
+    if own_fetcher:
+        fetcher = Fetcher(options)
+    pages = pages if pages is not None else {}
+    champions = champion_pairs(champions, resolve)
+    writer = nullcontext()
+    if export is not None:
+        writer = ExportWriter(export, ndjson=export.endswith('.ndjson'),
+                              metrics=METRICS)
+    try:
+        with writer:
+            for base_dict in scrape_results(champions, fetcher, parser,
+                                            workers, parse_workers, queue,
+                                            ordered, pages, options):
+                if export is not None:
+                    writer.write(base_dict)
+                yield base_dict
+    finally:
+        if own_fetcher:
+            fetcher.close()
+
+
+def scrape_results(champions, fetcher, parser, workers, parse_workers,
+                   queue, ordered, pages, options):
+    queue = max(queue, workers)
+
+    def scrape(champion, champ_id):
+        return scrape_champion(champion, champ_id, fetcher,
+                               pages.pop(champion, None), parser,
+                               options).base_dict
+    if workers <= 1 and parse_workers <= 0:
+        for champion, champ_id in champions:
+            yield scrape(champion, champ_id)
+        return
+    if parse_workers <= 0:
+        # Pages are fetched and parsed in the threads.
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            yield from scrape_window(
+                champions, functools.partial(pool.submit, scrape), queue,
+                ordered)
+        return
+    # I/O threads download pages and hand them to a process pool that
+    # parses them. The window bounds the champions in flight between
+    # download and the caller, so memory stays flat however long the
+    # roster is. A thread waits for its page to be parsed, so there are
+    # parse_workers more threads than downloads.
+    from concurrent.futures import ProcessPoolExecutor
+    with ThreadPoolExecutor(max_workers=workers + parse_workers) as io_pool, \
+            ProcessPoolExecutor(max_workers=parse_workers) as cpu_pool:
+        limit = threading.Semaphore(max(workers, 1))
+
+        def fetch_and_parse(champion, champ_id):
+            page = pages.pop(champion, None)
+            if page is None:
+                with limit:
+                    page = fetch_page(champion, fetcher, options)
+            if page is None:
+                # Missing or failed; a failure is already in METRICS.
+                return Scraper(options, champion, champ_id,
+                               fetcher=fetcher).base_dict
+            base_dict, metrics = cpu_pool.submit(
+                parse_page_job, champion, champ_id, page, parser,
+                options).result()
+            METRICS.merge(metrics)
+            return base_dict
+        yield from scrape_window(
+            champions, functools.partial(io_pool.submit, fetch_and_parse),
+            queue, ordered)
+
+
+async def ascrape_champions(champions, **kwargs):
+    # scrape_champions() as an async iterator. The scrape runs in the
+    # event loop's default executor; the loop only waits for results.
+    import asyncio
+    loop = asyncio.get_running_loop()
+    results = scrape_champions(champions, **kwargs)
+    done = object()
+    try:
+        while True:
+            base_dict = await loop.run_in_executor(None, next, results, done)
+            if base_dict is done:
+                return
+            yield base_dict
+    finally:
+        await loop.run_in_executor(None, results.close)
+
+
+def scrape_options():
+    # scrape_champions() keyword arguments from the command line.
+    return dict(parser=args.parser, workers=args.w,
+                parse_workers=args.parse_workers, queue=args.queue,
+                options=args)
+
+
+def scrape_many(champions, fetcher, pages=None):
+    # Yields the base_dict of each (champion, champ_id), in order.
+    return scrape_champions(champions, fetcher, pages=pages,
+                            **scrape_options())
+
+
+def retry_failed(champions, fetcher, writer):
+    # After a bulk run, scrape the champions whose page couldn't be
+    # fetched once more, one at a time, replacing their empty records.
+    # Champions that still fail are listed in args.failed.
+    # Returns the new base_dicts, by champion.
+    failed = METRICS.take_failures()
+    retried = OrderedDict()
+    if failed:
+        print("Retrying", len(failed), "champions that failed.\n")
+        for champion, champ_id in champions:
+            if champion in failed:
+                print(champion, "\n")
+                retried[champion] = scrape_champion(
+                    champion, champ_id, fetcher, parser=args.parser,
+                    options=args).base_dict
+                writer.write(retried[champion])
+    if METRICS.failures:
+        with open(args.failed, 'w') as file:
+            json.dump(METRICS.failures, file, indent=4)
+        print(len(METRICS.failures), "champions failed. See", args.failed)
+    return retried
+
+
+def main_all(fetcher):
+    # Returns False if another shard worker writes the export instead.
+    champions = get_champion_table().champions
+    if args.shard_queue:
+        return main_all_sharded(fetcher, champions)
+    if args.journal:
+        return main_all_journaled(fetcher, champions)
+    with export_writer() as writer:
+        for base_dict in scrape_many(champions, fetcher):
+            print(next(iter(base_dict)), "\n")
+            writer.write(base_dict)
+        retry_failed(champions, fetcher, writer)
+
+
+def page_revisions(fetcher, champions):
+    # Current revision of each champion's page, or {} if the wiki's API
+    # can't be reached.
+    try:
+        return DeltaScrape.fetch_revisions(
+            fetcher, DeltaScrape.api_url(args.wiki_url),
+            [champion for champion, _ in champions])
+    except (OSError, ValueError, http.client.HTTPException) as e:
+        print("Unable to check page revisions:", e)
+        return {}
+
+
+def main_all_journaled(fetcher, champions):
+    # Finished champions go to the journal as they complete. A run that
+    # is restarted after a crash or Ctrl-C only scrapes the champions
+    # the journal doesn't have, or whose page has a new revision since.
+    # Once no champion failed, the journal is compacted into the export
+    # and removed.
+    settings = {'wiki_url': args.wiki_url, 'audio': args.audio}
+    with ScrapeJournal(args.journal, settings, metrics=METRICS) as journal:
+        journal.revisions = page_revisions(fetcher, champions)
+        todo = [champ for champ in champions if not journal.is_done(champ[0])]
+        if journal.resumed:
+            print("Resuming from", args.journal + ":", len(todo), "of",
+                  len(champions), "champions left.\n")
+        for base_dict in scrape_many(todo, fetcher):
+            print(next(iter(base_dict)), "\n")
+            journal.write(base_dict)
+        retry_failed(todo, fetcher, journal)
+        with export_writer() as writer:
+            journal.compact(writer, champions)
+        if not METRICS.failures:
+            journal.remove()
+
+
+# Options that --shards passes on to the workers it starts: those of
+# fetching and parsing. Not the ones of this process's own run, like
+# --shard-reset, which would start over a queue that a late worker
+# finds already merged, or --profile.
+SHARD_WORKER_OPTIONS = (
+    '-e', '-i', '-w', '--parse-workers', '--queue', '--per-host', '--rate',
+    '--retries', '--target-latency', '--cache', '--cache-ttl',
+    '--cache-size', '--parser', '--lease', '--audio', '--wiki-url',
+    '--offline')
+
+
+def shard_worker_command(options, metrics):
+    # The command line of a worker started by --shards, from the
+    # parsed options of this one.
+    command = [sys.executable, os.path.abspath(__file__), '-a']
+    for option in SHARD_WORKER_OPTIONS:
+        value = getattr(options, option.lstrip('-').replace('-', '_'))
+        if value is True:
+            command.append(option)
+        elif value is not None and value is not False:
+            command += [option, str(value)]
+    return command + ['--shard-queue', options.shard_queue,
+                      '--shard-worker', '--metrics', metrics]
+
+
+def start_shard_workers():
+    # --shards N: N - 1 more workers on this machine, each running
+    # shard_worker_command(). They only scrape; this process merges.
+    # With --metrics, each writes its metrics as JSON next to the
+    # queue, for join_shard_workers() to merge.
+    workers = []
+    for n in range(1, args.shards):
+        metrics = ('{}.metrics.{}.json'.format(args.shard_queue, n)
+                   if args.metrics else '')
+        workers.append((subprocess.Popen(shard_worker_command(args, metrics)),
+                        metrics))
+    return workers
+
+
+def join_shard_workers(workers):
+    # Waits for the workers and adds their metrics to this process's.
+    # Their failures aren't merged: the queue has the final ones.
+    for worker, metrics in workers:
+        worker.wait()
+        if not metrics or not os.path.exists(metrics):
+            continue
+        with open(metrics, 'r') as file:
+            data = json.load(file)
+        os.remove(metrics)
+        data.pop('failures', None)
+        METRICS.merge(data)
+
+
+def main_all_sharded(fetcher, champions):
+    # Claims champions from the shared queue until none are left, then
+    # waits for the other workers' leases to finish or expire. The first
+    # worker to see every champion finished merges the queue into the
+    # export, in roster order. A stopped run resumes where the queue
+    # left off; leases of stopped workers are reclaimed once they expire.
+    settings = {'wiki_url': args.wiki_url, 'audio': args.audio}
+    queue = ShardQueue(args.shard_queue, champions, settings,
+                       lease=args.lease, metrics=METRICS,
+                       reset=args.shard_reset)
+    if queue.merged:
+        if not args.shard_worker:
+            print(args.shard_queue, "is already merged into the export."
+                  " Pass --shard-reset to scrape again.")
+        return False
+    if queue.resumed and not args.shard_worker:
+        print("Resuming from", args.shard_queue + ":", ", ".join(
+            "{} {}".format(n, state)
+            for state, n in queue.progress().items()), "\n")
+    workers = [] if args.shard_worker else start_shard_workers()
+    options = dict(scrape_options(), ordered=False,
+                   queue=max(args.w, 1) + args.parse_workers)
+    errors = {}  # Failures of results not yet completed
+    try:
+        with queue.heartbeat():
+            while True:
+                for base_dict in scrape_champions(queue.claims(), fetcher,
+                                                  **options):
+                    champion, record = next(iter(base_dict.items()))
+                    errors.update(METRICS.take_failures())
+                    if queue.complete(champion, record,
+                                      errors.pop(champion, None)):
+                        print(champion, "\n")
+                if args.shard_worker or queue.finish():
+                    break
+                if queue.is_finished():
+                    print("The export is merged by another worker.")
+                    return False
+                time.sleep(min(1, args.lease / 4))
+    finally:
+        queue.release()
+        join_shard_workers(workers)
+    if args.shard_worker:
+        return False
+    with export_writer() as writer:
+        queue.merge(writer)
+    METRICS.failures.update(queue.failures())
+    if METRICS.failures:
+        with open(args.failed, 'w') as file:
+            json.dump(METRICS.failures, file, indent=4)
+        print(len(METRICS.failures), "champions failed. See", args.failed)
+
+
+def main_delta(fetcher):
+    # Rescrape only the champions whose Quotes page changed since the
+    # previous corpus was made, or who are new to name_id_dict.json.
+    with open(args.delta, 'r') as file:
+        previous = json.load(file, object_pairs_hook=OrderedDict)
+    previous_revisions = DeltaScrape.load_revisions(args.revisions)
+    champions = get_champion_table().champions
+    # Without revisions, every champion counts as changed.
+    revisions = page_revisions(fetcher, champions)
+    stale = set(DeltaScrape.changed_champions(
+        [champion for champion, _ in champions], revisions,
+        previous_revisions, previous, args.since))
+    print(len(stale), "of", len(champions), "champion pages changed.\n")
+    scrapes = scrape_many([champ for champ in champions
+                           if champ[0] in stale], fetcher)
+    current = OrderedDict()
+    with export_writer() as writer:
+        for champion, _ in champions:
+            if champion in stale:
+                print(champion, "\n")
+                record = next(scrapes)
+            else:
+                record = OrderedDict([(champion, previous[champion])])
+            writer.write(record)
+            current.update(record)
+        for record in retry_failed([champ for champ in champions
+                                    if champ[0] in stale],
+                                   fetcher, writer).values():
+            current.update(record)
+        # Champions that still failed keep their previous record instead
+        # of an empty one, which the diff would report as all removed.
+        for champion in METRICS.failures:
+            if champion in previous:
+                record = OrderedDict([(champion, previous[champion])])
+                writer.write(record)
+                current.update(record)
+    diff = DeltaScrape.diff_corpora(previous, current)
+    with open(args.diff, 'w') as file:
+        json.dump(diff, file, indent=4)
+    print("Changes for", len(diff), "champions written to", args.diff)
+    # Champions that failed keep their previous revision, so that the
+    # next run scrapes them again instead of copying an empty record.
+    previous_revisions.update((champion, revision)
+                              for champion, revision in revisions.items()
+                              if revision is not None and
+                              champion not in METRICS.failures)
+    DeltaScrape.save_revisions(previous_revisions, args.revisions)
 
 
 def main():
@@ -456,24 +957,68 @@ def main():
                            " | 'y' for yes ")
             if input_.lower() == 'y':
                 update_name_id_dict(prompted=True)
+    # One pooled keep-alive HTTP session for the whole run.
+    cache = None
+    if args.cache or args.offline:
+        # Offline replays keep every entry, however old and however
+        # big the cache: an evicted page couldn't be fetched again.
+        cache = ResponseCache(args.cache or '.http_cache',
+                              ttl=None if args.offline
+                              else args.cache_ttl * 24 * 3600,
+                              max_size=None if args.offline
+                              else args.cache_size * 1024 * 1024)
+    fetcher = Fetcher(args, per_host=args.per_host, rate=args.rate,
+                      cache=cache, offline=args.offline, retries=args.retries,
+                      target_latency=args.target_latency, metrics=METRICS)
+    exported = None
     if not args.a:
-        ip = InputParser(args)
-    if args.d and hasFile['RiotAPIData.py'] and hasFile['riot_api_key.json']:
+        ip = InputParser(args, fetcher)
+    if args.d and hasFile['RiotAPIData.py'] and \
+            hasFile['riot_api_key.json'] and not args.shard_worker:
         update_name_id_dict()
     if args.i and not hasFile['name_id_dict.json']:
         print("No file 'name_id_dict.json' found. Unable to lookup champion"
               " IDs. Using 0 instead.")
-    if args.a and hasFile['name_id_dict.json']:  # Scrape all
-        main_all()
+    if args.a and args.delta and hasFile['name_id_dict.json']:
+        main_delta(fetcher)  # Scrape changed
+    elif args.a and hasFile['name_id_dict.json']:  # Scrape all
+        exported = main_all(fetcher)
     elif args.m:  # Scrape multi
         main_multi(ip)
     elif not args.a:
         main_one(ip)  # Scrape one
+    if args.audio_dir and exported is not False:
+        download_audio(fetcher)
 
-    print("Input list:")
-    print(ip.input_list)
-    print("Champions found:")
-    print(set(ip.champion_list))
+    if not args.a:
+        print("Input list:")
+        print(ip.input_list)
+        print("Champions found:")
+        print(set(ip.champion_list))
+
+
+def run():
+    # main(), optionally under cProfile. The metrics file is written
+    # however the run ends.
+    try:
+        if args.profile:
+            import cProfile
+            import pstats
+            profiler = cProfile.Profile()
+            try:
+                profiler.runcall(main)
+            finally:
+                profiler.dump_stats(args.profile + '.prof')
+                with open(args.profile, 'w') as file:
+                    stats = pstats.Stats(profiler, stream=file)
+                    stats.sort_stats('cumulative').print_stats(40)
+                    stats.sort_stats('tottime').print_stats(20)
+                print("Profile written to", args.profile)
+        else:
+            main()
+    finally:
+        if args.metrics:
+            METRICS.write(args.metrics)
 
 
 def check_for_files():
@@ -489,12 +1034,14 @@ def check_for_files():
                 hasFile[file] = True
         except FileNotFoundError as e:
             print(e)
+    # RiotAPIData is only imported by -d, but it can't work without this.
+    if importlib.util.find_spec('riotwatcher') is None:
+        hasFile['RiotAPIData.py'] = False
     print()
     return hasFile
 
 
-if __name__ == '__main__':
-    hasFile = check_for_files()
+def argument_parser():
     parser = argparse.ArgumentParser()
     parser.add_argument("-m", help="Download quotes for multiple champions.",
                         action='store_true')
@@ -506,5 +1053,143 @@ if __name__ == '__main__':
                         " champion ID.", action='store_true')
     parser.add_argument("-e", help="Print exceptions for error reporting.",
                         action='store_true')
-    args = parser.parse_args()
-    main()
+    parser.add_argument("--riot-ttl", help="Hours that -d trusts the last"
+                        " check of the live version, recorded in"
+                        " 'riot_versions.json', before asking the Riot API"
+                        " again. Defaults to 24.", type=float, default=24,
+                        metavar='HOURS')
+    parser.add_argument("-w", help="Number of pages to scrape concurrently"
+                        " with -a. Defaults to 1 (sequential).",
+                        type=int, default=1, metavar='WORKERS')
+    parser.add_argument("--parse-workers", help="With -a, parse pages in"
+                        " this many processes while -w threads download"
+                        " them. Defaults to 0 (parse in the download"
+                        " threads).", type=int, default=0)
+    parser.add_argument("--queue", help="Max champions in flight between"
+                        " download and export with --parse-workers."
+                        " Defaults to 16.", type=int, default=16)
+    parser.add_argument("--per-host", help="Max requests in flight per host."
+                        " Defaults to 4.", type=int, default=4)
+    parser.add_argument("--rate", help="Max requests per second per host."
+                        " Defaults to 5.", type=float, default=5.0)
+    parser.add_argument("--retries", help="Retries per request on"
+                        " throttling, server or network errors, with"
+                        " jittered exponential backoff or Retry-After."
+                        " Defaults to 4.", type=int, default=4)
+    parser.add_argument("--target-latency", help="Seconds. Slower responses"
+                        " halve the requests in flight per host, faster"
+                        " ones let it grow up to --per-host. Defaults to 5.",
+                        type=float, default=5.0)
+    parser.add_argument("--failed", help="Where champions that still failed"
+                        " after a follow-up pass are listed. Defaults to"
+                        " 'failed_champions.json'.",
+                        default='failed_champions.json')
+    parser.add_argument("--cache", help="Cache pages on disk and revalidate"
+                        " them with conditional requests. Defaults to"
+                        " '.http_cache' when no directory is given.",
+                        nargs='?', const='.http_cache', metavar='DIR')
+    parser.add_argument("--cache-ttl", help="Days before an unvalidated"
+                        " cached page is evicted. Not applied with"
+                        " --offline. Defaults to 7.", type=float, default=7)
+    parser.add_argument("--cache-size", help="Max size of the cache in MB."
+                        " Not applied with --offline. Defaults to 200.",
+                        type=float, default=200)
+    parser.add_argument("--parser", help="HTML parser backend. 'stream'"
+                        " parses each page in a single pass without building"
+                        " a document tree. Defaults to 'bs4'.",
+                        choices=('bs4', 'stream'), default='bs4')
+    parser.add_argument("--ndjson", help="Export to"
+                        " 'quotes_list_export.ndjson', one champion per line,"
+                        " instead of 'quotes_list_export.json'.",
+                        action='store_true')
+    parser.add_argument("--binary", help="Also export a compact binary"
+                        " corpus, 'quotes_list_export.lwqc'. See"
+                        " BinaryCorpus.py.", action='store_true')
+    parser.add_argument("--dedup", help="Also export"
+                        " 'quotes_list_export.dedup.json', where each"
+                        " distinct quote line is stored once. See"
+                        " DedupCorpus.py.", action='store_true')
+    parser.add_argument("--index", help="Update a full-text search index of"
+                        " the scraped quotes. Defaults to 'quotes_index.json'"
+                        " when no file is given. Query it with"
+                        " QuoteSearch.py.",
+                        nargs='?', const='quotes_index.json', metavar='FILE')
+    parser.add_argument("--journal", help="With -a, record each finished"
+                        " champion here, so that a restarted run skips"
+                        " them unless their page has a new revision. Checking"
+                        " revisions queries the wiki's API. Removed once the"
+                        " export is complete. Defaults to"
+                        " 'scrape_journal.ndjson' when no file is given.",
+                        nargs='?', const='scrape_journal.ndjson',
+                        metavar='FILE')
+    parser.add_argument("--shard-queue", help="With -a, claim champions"
+                        " from this work queue, an SQLite file shared by"
+                        " every worker of the run, which may be on other"
+                        " hosts. Each worker leases one champion per -w"
+                        " thread, and the first to see them all done writes"
+                        " the export. Rerun to resume.",
+                        metavar='FILE')
+    parser.add_argument("--shards", help="With -a, scrape in this many"
+                        " worker processes on this machine, through"
+                        " --shard-queue ('shard_queue.sqlite3' unless"
+                        " given). -w, --rate and --per-host apply to each"
+                        " worker. Defaults to 1.", type=int, default=1)
+    parser.add_argument("--shard-reset", help="Start a --shard-queue that"
+                        " was already merged over. Without it, a worker"
+                        " that joins a merged queue exits. A queue still in"
+                        " progress is joined either way.",
+                        action='store_true')
+    parser.add_argument("--lease", help="Seconds a shard worker holds a"
+                        " champion without renewing its lease before other"
+                        " workers may take it over. Defaults to 60.",
+                        type=float, default=60)
+    parser.add_argument("--shard-worker", help=argparse.SUPPRESS,
+                        action='store_true')
+    parser.add_argument("--delta", help="With -a, only rescrape champions"
+                        " whose Quotes page changed since this previous"
+                        " corpus, or who are new.", metavar='PREVIOUS_JSON')
+    parser.add_argument("--revisions", help="Page revisions recorded by"
+                        " --delta runs. Defaults to 'page_revisions.json'.",
+                        default='page_revisions.json')
+    parser.add_argument("--since", help="With --delta, treat pages without"
+                        " a recorded revision as unchanged if last edited"
+                        " before this ISO 8601 time, e.g."
+                        " 2018-05-02T00:00:00Z.")
+    parser.add_argument("--diff", help="Where --delta writes the added,"
+                        " removed and changed quote IDs. Defaults to"
+                        " 'quotes_diff.json'.", default='quotes_diff.json')
+    parser.add_argument("--audio", help="Record the URL of each quote's"
+                        " audio file in the export, under 'audio'.",
+                        action='store_true')
+    parser.add_argument("--audio-dir", help="After scraping, download the"
+                        " audio files of the export into DIR, resuming"
+                        " partial downloads and skipping finished ones."
+                        " Implies --audio.", metavar='DIR')
+    parser.add_argument("--audio-workers", help="Concurrent audio downloads."
+                        " Defaults to 4.", type=int, default=4)
+    parser.add_argument("--audio-budget", help="Max MB of audio files kept"
+                        " in --audio-dir.", type=float, metavar='MB')
+    parser.add_argument("--wiki-url", help="Base URL of the wiki. Defaults"
+                        " to " + WIKI_URL + ".", default=WIKI_URL)
+    parser.add_argument("--offline", help="Replay pages from the cache only,"
+                        " without network access.", action='store_true')
+    parser.add_argument("--profile", help="Run under cProfile and write a"
+                        " summary to FILE, and the raw stats to FILE.prof."
+                        " Defaults to 'profile.txt' when no file is given.",
+                        nargs='?', const='profile.txt', metavar='FILE')
+    parser.add_argument("--metrics", help="Where to write per-stage and"
+                        " per-champion timings and counters at the end of"
+                        " the run. Prometheus textfile format if FILE ends"
+                        " in .prom, JSON otherwise. Defaults to"
+                        " 'scrape_metrics.json'. Pass '' to disable.",
+                        default='scrape_metrics.json', metavar='FILE')
+    return parser
+
+
+if __name__ == '__main__':
+    hasFile = check_for_files()
+    args = argument_parser().parse_args()
+    args.audio = args.audio or bool(args.audio_dir)
+    if args.shards > 1 and not args.shard_queue:
+        args.shard_queue = 'shard_queue.sqlite3'
+    run()